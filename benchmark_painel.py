@@ -0,0 +1,304 @@
+"""
+BENCHMARK DAS ETAPAS DE TRATAMENTO DO PAINEL DOX
+Gera planilhas sintéticas com o mesmo layout das reais (1k / 10k / 100k linhas),
+mede o tempo e o pico de memória de cada etapa tratar_* isolada (sem Google)
+e grava um relatório JSON para comparar entre versões.
+Os casos sqlite_* medem a leitura completa (ler_com_retry + tratamento) pelo backend SQLite.
+
+Uso:
+    python benchmark_painel.py
+    python benchmark_painel.py --linhas 1000 10000 --repeticoes 5 --saida bench.json
+    python benchmark_painel.py --comparar bench_anterior.json
+
+Banco local para rodar o painel sem Google (PAINEL_BACKEND=sqlite):
+    python benchmark_painel.py --semear-sqlite painel_local.sqlite3 --linhas 10000
+    python benchmark_painel.py --semear-sqlite painel_local.sqlite3 --importar-csv SISTEMA Dados_Credito credito.csv
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# As leituras medidas aqui passam pelo backend SQLite (arquivo próprio do benchmark), nunca pelo Google
+os.environ["PAINEL_BACKEND"] = "sqlite"
+os.environ.setdefault("PAINEL_SQLITE_PATH", "benchmark_painel.sqlite3")
+
+import painelvendedorTESTE as painel
+
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000]
+SEMENTE = 42
+
+FILIAIS = ["PINHEIRAL", "SJ BICAS", "SAO PAULO", "BETIM"]
+VENDEDORES = ["JOAO DA SILVA", "MARIA SOUZA", "CARLOS PEREIRA", "ANA LIMA", "PAULO ROCHA", "FERNANDA COSTA"]
+GERENTES = ["ROBERTO ALVES", "PATRICIA GOMES", "MARCOS DIAS"]
+CLIENTES = ["METALURGICA %03d LTDA" % i for i in range(300)]
+PRODUTOS = ["BOBINA LQ %s" % m for m in ("1,50", "2,00", "2,65", "3,00", "4,75")] + \
+           ["CHAPA LCG %s" % m for m in ("0,50", "0,75", "1,20")] + ["TIRA SLITTER %d MM" % l for l in (50, 120, 300)]
+EMOJIS = ["", "", "", "🔥 ", "⭐ ", "🔴 ", "🟢 ", "1️⃣ ", "⏳ ", "⚖️ "]
+MAQUINAS = ["FAGOR", "ESQUADROS", "MARAFON", "DIVIMEC 1 SLITTER", "ENDIREITADEIRA"]
+PROBLEMAS = ["Elétrico", "Mecânico", "Hidráulico", "Pneumático"]
+
+# ==============================================================================
+# GERADORES DE PLANILHAS SINTÉTICAS (tudo texto, como vem do get_all_values)
+# ==============================================================================
+
+def numero_br(valor, casas):
+    """1234.5 -> '1.234,500' (formato que a planilha devolve)."""
+    return f"{valor:,.{casas}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def data_br(rnd, dias_atras=400, com_hora=False):
+    data = datetime(2026, 1, 1) - timedelta(days=rnd.randint(0, dias_atras), minutes=rnd.randint(0, 1440))
+    return data.strftime("%d/%m/%Y %H:%M:%S" if com_hora else "%d/%m/%Y")
+
+def gerar_estoque(linhas, rnd):
+    return pd.DataFrame({
+        "FILIAL": [rnd.choice(FILIAIS) for _ in range(linhas)],
+        "ARMAZEM": [f"{rnd.randint(1, 20):02d}" for _ in range(linhas)],
+        "PRODUTO": [rnd.choice(PRODUTOS) for _ in range(linhas)],
+        "LOTE": [f"{rnd.randint(0, 999999):06d}" for _ in range(linhas)],
+        "ESPES": [str(rnd.choice([50, 75, 120, 150, 200, 265, 300, 475])) for _ in range(linhas)],
+        "LARGURA": [str(rnd.choice([50, 120, 300, 1000, 1200, 1500])) for _ in range(linhas)],
+        "COMPRIMENTO": [str(rnd.choice([0, 2000, 3000, 6000])) for _ in range(linhas)],
+        "QTDE": [numero_br(rnd.uniform(0, 25000), 3) for _ in range(linhas)],
+        "EMPENHADO": [numero_br(rnd.uniform(0, 5000), 3) for _ in range(linhas)],
+        "DISPONIVEL": [numero_br(rnd.uniform(-100, 20000), 3) if rnd.random() > 0.02 else "" for _ in range(linhas)],
+        "DIAS.ESTOQUE": [data_br(rnd) for _ in range(linhas)],
+    })
+
+def gerar_faturamento(linhas, rnd):
+    return pd.DataFrame({
+        " DATA_EMISSAO": [data_br(rnd, 60) for _ in range(linhas)],
+        "FILIAL": [rnd.choice(FILIAIS) for _ in range(linhas)],
+        "CLIENTE": [rnd.choice(CLIENTES) for _ in range(linhas)],
+        "VENDEDOR": [rnd.choice(VENDEDORES) for _ in range(linhas)],
+        "NOTA": [str(rnd.randint(1, 999999)) for _ in range(linhas)],
+        "TONS": [numero_br(rnd.uniform(0.1, 40), 3) for _ in range(linhas)],
+    })
+
+def gerar_aba_pedidos(linhas, rnd, layout_pcp):
+    """Aba de máquina: Pinheiral usa o layout do PCP online; Bicas, o layout já traduzido."""
+    colunas = (["PEDIDO", "CLIENTE CORRETO", "PRODUTO", "QTDE", "PREVISÃO", "VEND. CORRETO", "GER. CORRETO"] if layout_pcp else
+               ["Número do Pedido", "Cliente Correto", "Produto", "Quantidade", "Prazo", "Vendedor Correto", "Gerente Correto"])
+    valores = [
+        [rnd.choice(EMOJIS) + str(rnd.randint(1, 99999)) + rnd.choice(["", ".0"]) for _ in range(linhas)],
+        [rnd.choice(EMOJIS) + rnd.choice(CLIENTES) for _ in range(linhas)],
+        [rnd.choice(EMOJIS) + rnd.choice(PRODUTOS) + rnd.choice(["", " ✅", " (URGENTE)"]) for _ in range(linhas)],
+        [numero_br(rnd.uniform(0.5, 30), 3) for _ in range(linhas)],
+        [data_br(rnd, 30) if rnd.random() > 0.1 else "" for _ in range(linhas)],
+        [rnd.choice(VENDEDORES) for _ in range(linhas)],
+        [rnd.choice(GERENTES) for _ in range(linhas)],
+    ]
+    return pd.DataFrame(dict(zip(colunas, valores)))
+
+def gerar_pedidos(linhas, rnd):
+    """Lista de abas lidas [(df, aba, filial, traduzir_pcp)] com as linhas espalhadas pelas máquinas."""
+    abas = [(aba, "PINHEIRAL", True) for aba in painel.ABAS_PINHEIRAL] + [(aba, "SJ BICAS", False) for aba in painel.ABAS_BICAS]
+    por_aba = max(1, linhas // len(abas))
+    return [(gerar_aba_pedidos(por_aba, rnd, traduzir), aba, filial, traduzir) for aba, filial, traduzir in abas]
+
+def gerar_carteira(linhas, rnd):
+    """Carteira do robô: as linhas DOX BRASIL apontam para um pedido de SAO PAULO pelo PED/PROP SF."""
+    clientes = CLIENTES + ["DOX BRASIL IND E COM"] * 30
+    return pd.DataFrame({
+        "FILIAL": [rnd.choice(FILIAIS) for _ in range(linhas)],
+        "PEDIDO": [f"{rnd.randint(1, 999999):06d}" for _ in range(linhas)],
+        "PED/PROP SF": [f"{rnd.randint(1, max(1, linhas // 4)):06d}" for _ in range(linhas)],
+        "CLIENTE": [rnd.choice(clientes) for _ in range(linhas)],
+        "LOTE": [f"{rnd.randint(0, 999999):06d}" for _ in range(linhas)],
+        "PRODUTO": [rnd.choice(PRODUTOS) for _ in range(linhas)],
+        "TONS": [numero_br(rnd.uniform(0.1, 40), 3) for _ in range(linhas)],
+        "STATUS": [rnd.choice(["EM PRODUÇÃO", "AGUARDANDO", "LIBERADO"]) for _ in range(linhas)],
+        "VENDEDOR": [rnd.choice(VENDEDORES) for _ in range(linhas)],
+        "GERENTE": [rnd.choice(GERENTES) for _ in range(linhas)],
+    })
+
+def gerar_manutencao(linhas, rnd):
+    return pd.DataFrame({
+        "Carimbo de data/hora": [data_br(rnd, 120, com_hora=True) for _ in range(linhas)],
+        "Qual a máquina?": [rnd.choice(MAQUINAS) for _ in range(linhas)],
+        "Operador": [rnd.choice(VENDEDORES) for _ in range(linhas)],
+        "Tipo de problema": [rnd.choice(PROBLEMAS) for _ in range(linhas)],
+        "Descrição": ["Falha no equipamento %d" % rnd.randint(1, 500) for _ in range(linhas)],
+        "Status": [rnd.choice(["Aberto", "Em Andamento", "Concluido"]) for _ in range(linhas)],
+        "Prioridade": [rnd.choice(["Baixa", "Media", "Alta"]) for _ in range(linhas)],
+        "Mecanico": [rnd.choice(GERENTES) for _ in range(linhas)],
+        "Inicio": [data_br(rnd, 120, com_hora=True) for _ in range(linhas)],
+        "Fim": [data_br(rnd, 120, com_hora=True) for _ in range(linhas)],
+        "Solucao": ["Troca de peça" for _ in range(linhas)],
+    })
+
+def gerar_coluna_numerica(linhas, rnd):
+    """Coluna como TONS/QTDE: números brasileiros, sem milhar, vazios, 'nan' e lixo."""
+    formas = [lambda: numero_br(rnd.uniform(0, 50000), 3), lambda: f"{rnd.uniform(0, 100):.2f}",
+              lambda: "", lambda: "nan", lambda: " 12,5 ", lambda: "-"]
+    pesos = [70, 20, 4, 2, 2, 2]
+    return pd.Series([rnd.choices(formas, pesos)[0]() for _ in range(linhas)])
+
+def gerar_coluna_pcp(linhas, rnd):
+    """Coluna de cliente/produto do PCP, com emojis de status no meio do texto."""
+    return pd.Series([rnd.choice(EMOJIS) + rnd.choice(CLIENTES + PRODUTOS) + rnd.choice(["", " ✅", " 🔥", " (URGENTE)"])
+                      for _ in range(linhas)])
+
+def gerar_coluna_valores(linhas, rnd):
+    """Coluna de valores já numéricos (toneladas, saldos), com alguns vazios."""
+    return pd.Series([rnd.uniform(-5000, 2000000) if rnd.random() > 0.05 else None for _ in range(linhas)], dtype=float)
+
+def limpeza_pcp_laco(serie):
+    """Limpeza como era antes: um str.replace por emoji e depois o filtro de símbolos."""
+    for emoji in painel.EMOJIS_PCP:
+        serie = serie.str.replace(emoji, '', regex=False)
+    return serie.str.replace(r'[^\w\s\.,\-\/\(\)]', '', regex=True).str.strip()
+
+# ==============================================================================
+# CASOS MEDIDOS: nome -> (gerador, etapa)
+# ==============================================================================
+
+def semear_aba(url, aba, gerador):
+    """Casos de leitura: grava a planilha sintética no SQLite do benchmark e entrega (url, aba) para a etapa."""
+    def gerar(linhas, rnd):
+        painel.obter_backend().importar_dataframe(url, aba, gerador(linhas, rnd))
+        return (url, aba)
+    return gerar
+
+def copiar_entrada(entrada):
+    # As etapas alteram o DataFrame recebido: cada repetição parte de uma cópia nova
+    if isinstance(entrada, tuple): # (url, aba) dos casos sqlite_*: a etapa lê do banco
+        return entrada
+    if isinstance(entrada, list):
+        return [(df.copy(), aba, filial, traduzir) for df, aba, filial, traduzir in entrada]
+    return entrada.copy()
+
+CASOS = {
+    "carregar_estoque": (gerar_estoque, painel.tratar_estoque),
+    "ler_dados_nuvem_generico": (gerar_faturamento, painel.tratar_dados_nuvem),
+    "carregar_dados_pedidos": (gerar_pedidos, painel.consolidar_pedidos),
+    "carregar_dados_manutencao": (gerar_manutencao, painel.tratar_manutencao),
+    # Leitura + tratamento pelo backend SQLite (mesmo caminho do painel com PAINEL_BACKEND=sqlite)
+    "sqlite_carregar_estoque": (semear_aba(painel.URL_SISTEMA, "Dados_Estoque", gerar_estoque),
+                                lambda pedido: painel.tratar_estoque(painel.ler_com_retry(*pedido))),
+    "sqlite_ler_dados_nuvem_generico": (semear_aba(painel.URL_SISTEMA, "Dados_Faturamento", gerar_faturamento),
+                                        lambda pedido: painel.tratar_dados_nuvem(painel.ler_com_retry(*pedido), pedido[1])),
+    # Conversor antigo (célula a célula) x vetorizado, na mesma coluna
+    "converte_numero_seguro": (gerar_coluna_numerica, lambda serie: serie.apply(painel.converte_numero_seguro)),
+    "converter_coluna_numerica": (gerar_coluna_numerica, painel.converter_coluna_numerica),
+    # Limpeza do PCP: laço de replaces x regex única
+    "limpeza_pcp_laco": (gerar_coluna_pcp, limpeza_pcp_laco),
+    "limpar_texto_pcp": (gerar_coluna_pcp, painel.limpar_texto_pcp),
+    # Formatação para exibição: célula a célula x coluna inteira
+    "formatar_peso_brasileiro": (gerar_coluna_valores, lambda serie: serie.apply(painel.formatar_peso_brasileiro)),
+    "formatar_peso_coluna": (gerar_coluna_valores, painel.formatar_peso_coluna),
+    "formatar_moeda": (gerar_coluna_valores, lambda serie: serie.apply(painel.formatar_moeda)),
+    "formatar_moeda_coluna": (gerar_coluna_valores, painel.formatar_moeda_coluna),
+}
+
+def semear_sqlite(caminho, linhas, importacoes):
+    """
+    Enche um banco SQLite com as planilhas sintéticas para rodar o painel inteiro offline
+    (PAINEL_BACKEND=sqlite PAINEL_SQLITE_PATH=<caminho> streamlit run painelvendedorTESTE.py)
+    e depois importa os CSVs pedidos (planilha, aba, arquivo), que substituem a aba sintética.
+    """
+    backend = painel.BackendSQLite(caminho)
+    rnd = random.Random(SEMENTE)
+    sistema = {
+        "Dados_Estoque": gerar_estoque, "Dados_Carteira": gerar_carteira, "Dados_Manutencao": gerar_manutencao,
+        "Dados_Faturamento": gerar_faturamento, "Dados_Faturamento_Transf": gerar_faturamento,
+        "Dados_Fat_Vendedores": gerar_faturamento,
+    }
+    for aba, gerador in sistema.items():
+        backend.importar_dataframe(painel.URL_SISTEMA, aba, gerador(linhas, rnd))
+    for url, abas, layout_pcp in [(painel.URL_PINHEIRAL, painel.ABAS_PINHEIRAL, True), (painel.URL_BICAS, painel.ABAS_BICAS, False)]:
+        for aba in abas:
+            backend.importar_dataframe(url, aba, gerar_aba_pedidos(max(1, linhas // 17), rnd, layout_pcp))
+    # Usuário para entrar no painel local (só existe neste arquivo)
+    backend.importar_dataframe(painel.URL_SISTEMA, "Usuarios", pd.DataFrame([
+        {"Login": "teste", "Senha": "teste", "Nome Vendedor": "USUARIO TESTE", "Email": "", "Tipo": "admin"}]))
+    for planilha, aba, arquivo in importacoes:
+        backend.importar_csv(planilha, aba, arquivo)
+        print(f"Importado {arquivo} -> {planilha}/{aba}")
+    print(f"Banco {caminho} pronto ({linhas} linhas por aba; login teste / teste)")
+
+def medir(etapa, entrada, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        dados = copiar_entrada(entrada)
+        inicio = time.perf_counter()
+        resultado = etapa(dados)
+        tempos.append(time.perf_counter() - inicio)
+
+    # Pico de memória numa execução separada (o tracemalloc deixa o código mais lento)
+    dados = copiar_entrada(entrada)
+    tracemalloc.start()
+    etapa(dados)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "tempo_min_s": min(tempos),
+        "tempo_mediana_s": statistics.median(tempos),
+        "pico_memoria_mb": pico / 1024 / 1024,
+        "linhas_saida": len(resultado),
+    }
+
+def executar(casos, tamanhos, repeticoes):
+    resultados = []
+    for nome in casos:
+        gerador, etapa = CASOS[nome]
+        for linhas in tamanhos:
+            entrada = gerador(linhas, random.Random(SEMENTE))
+            medicao = medir(etapa, entrada, repeticoes)
+            resultados.append(dict(caso=nome, linhas=linhas, repeticoes=repeticoes, **medicao))
+            print(f"{nome:<28} {linhas:>8} linhas  {medicao['tempo_mediana_s'] * 1000:>10.1f} ms  "
+                  f"{medicao['pico_memoria_mb']:>8.1f} MB")
+    return resultados
+
+def comparar(resultados, caminho_anterior):
+    with open(caminho_anterior, encoding="utf-8") as arquivo:
+        anteriores = {(r["caso"], r["linhas"]): r for r in json.load(arquivo)["resultados"]}
+    print(f"\nComparação com {caminho_anterior} (mediana; < 1.00 = mais rápido agora):")
+    for r in resultados:
+        antigo = anteriores.get((r["caso"], r["linhas"]))
+        if antigo and antigo["tempo_mediana_s"] > 0:
+            razao = r["tempo_mediana_s"] / antigo["tempo_mediana_s"]
+            print(f"{r['caso']:<28} {r['linhas']:>8} linhas  {razao:>6.2f}x tempo  "
+                  f"{r['pico_memoria_mb'] - antigo['pico_memoria_mb']:>+8.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das etapas de tratamento do Painel Dox")
+    parser.add_argument("--linhas", type=int, nargs="+", default=TAMANHOS_PADRAO, help="Tamanhos das planilhas sintéticas")
+    parser.add_argument("--casos", nargs="+", choices=sorted(CASOS), default=list(CASOS), help="Carregadores a medir")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", default="benchmark_painel.json", help="Arquivo JSON do relatório")
+    parser.add_argument("--comparar", help="Relatório JSON anterior para comparar")
+    parser.add_argument("--semear-sqlite", metavar="CAMINHO", help="Só cria o banco SQLite para o painel offline (usa o maior --linhas)")
+    parser.add_argument("--importar-csv", nargs=3, action="append", default=[], metavar=("PLANILHA", "ABA", "ARQUIVO"),
+                        help="Com --semear-sqlite: importa um CSV exportado da planilha (PLANILHA = SISTEMA, PINHEIRAL ou BICAS)")
+    args = parser.parse_args()
+
+    if args.semear_sqlite:
+        semear_sqlite(args.semear_sqlite, max(args.linhas), args.importar_csv)
+        return
+
+    resultados = executar(args.casos, args.linhas, args.repeticoes)
+    relatorio = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "maquina": platform.platform(),
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nRelatório gravado em {args.saida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import pytz
 import altair as alt
 import time
+import random
+import threading
+import atexit
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
 import io
+import xlsxwriter
+import re
+import os
+import json
+import sqlite3
+import csv
+import contextlib
 
 # ==============================================================================
 # CONFIGURAÇÕES GERAIS E URLS
@@ -38,103 +53,990 @@ except Exception:
 # 1. CONEXÃO GSPREAD OTIMIZADA ("Cofre Aberto")
 # ==============================================================================
 
+# Quantidade máxima de conexões keep-alive abertas com o Google (compartilhadas por todos)
+POOL_CONEXOES_GOOGLE = 10
+
+@st.cache_resource(show_spinner=False)
+def criar_pool_gspread():
+    """
+    Cria UM cliente gspread para o processo inteiro (todas as sessões/vendedores).
+    A autenticação e o token são feitos uma única vez, e as requisições
+    reaproveitam um conjunto limitado de conexões HTTP keep-alive.
+    """
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    try:
+        creds_dict = dict(st.secrets["gcp_service_account"])
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+    except:
+        creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
+
+    client = gspread.authorize(creds)
+
+    # Limita e reaproveita as conexões HTTP da sessão autorizada
+    sessao_http = getattr(client, "session", None)
+    if sessao_http is None and hasattr(client, "http_client"):
+        sessao_http = client.http_client.session
+    if sessao_http is not None:
+        adaptador = HTTPAdapter(pool_connections=POOL_CONEXOES_GOOGLE, pool_maxsize=POOL_CONEXOES_GOOGLE, pool_block=True)
+        sessao_http.mount("https://", adaptador)
+
+    return {"client": client, "lock": threading.Lock()}
+
 def get_gspread_client_cached():
     """
-    Substitui a conexão antiga. Mantém o cliente na memória da sessão
-    para evitar re-autenticar a cada clique (Economia de Cota e Tempo).
+    Substitui a conexão antiga. Devolve o cliente compartilhado do processo
+    (ver criar_pool_gspread) para evitar re-autenticar a cada sessão/clique.
     """
-    if 'gspread_client' not in st.session_state:
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        try:
-            creds_dict = dict(st.secrets["gcp_service_account"])
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        except:
-            creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-        
-        client = gspread.authorize(creds)
-        st.session_state['gspread_client'] = client
-        return client
-    
-    # Verifica se o token expirou e renova se necessário
-    client = st.session_state['gspread_client']
+    pool = criar_pool_gspread()
+    client = pool["client"]
+
+    # Verifica se o token expirou e renova se necessário (uma thread por vez)
     if client.auth.expired:
-        client.login()
+        with pool["lock"]:
+            if client.auth.expired:
+                client.login()
     return client
 
+# ==============================================================================
+# MOTOR DE LEITURA PARALELA (COM LIMITE DE COTA)
+# ==============================================================================
+
+# Cota do Google Sheets: 60 leituras e 60 escritas por minuto para a conta de serviço.
+# Usamos 90% dela para sobrar folga para o robô.
+COTA_LEITURAS_POR_MINUTO = 60
+COTA_ESCRITAS_POR_MINUTO = 60
+RAJADA_MAXIMA_LEITURAS = 10
+MAX_LEITURAS_SIMULTANEAS = 6
+
+# Retentativas: espera exponencial (base * 2^tentativa) com sorteio, limitada ao teto
+ESPERA_MAXIMA_RETENTATIVA = 30
+# Tempo total que a leitura da aba Usuarios pode levar (somando as esperas) antes de desistir
+PRAZO_LEITURA_LOGIN = 10
+
+class LimitadorCota:
+    """
+    Balde de fichas (token bucket) compartilhado pelo processo.
+    Cada requisição ao Google consome uma ficha; as fichas voltam no ritmo da cota.
+    Se o balde esvaziar, quem chegar espera a sua vez em vez de tomar um 429.
+    """
+    def __init__(self, por_minuto, rajada):
+        self.taxa_por_segundo = por_minuto / 60.0
+        self.capacidade = float(rajada)
+        self.fichas = float(rajada)
+        self.ultima_recarga = time.monotonic()
+        self.pausado_ate = 0.0
+        self.lock = threading.Lock()
+
+    def pausar(self, segundos):
+        """Cota estourada (429): esvazia o balde e segura TODO mundo até o tempo indicado."""
+        with self.lock:
+            self.pausado_ate = max(self.pausado_ate, time.monotonic() + segundos)
+            self.fichas = 0.0
+
+    def adquirir(self, quantidade=1):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                if agora < self.pausado_ate:
+                    espera = self.pausado_ate - agora
+                else:
+                    # Depois de uma pausa, as fichas voltam a encher a partir do fim dela
+                    inicio = max(self.ultima_recarga, self.pausado_ate)
+                    self.fichas = min(self.capacidade, self.fichas + (agora - inicio) * self.taxa_por_segundo)
+                    self.ultima_recarga = agora
+                    if self.fichas >= quantidade:
+                        self.fichas -= quantidade
+                        return
+                    espera = (quantidade - self.fichas) / self.taxa_por_segundo
+            time.sleep(espera)
+
+@st.cache_resource(show_spinner=False)
+def obter_motor_leitura():
+    """
+    Recursos do processo para leituras em paralelo:
+    - limitador / limitador_escrita: controlam o ritmo das requisições (cotas do Sheets).
+    - leituras: threads que fazem as chamadas ao Google (url, aba).
+    - carregadores: threads que rodam as funções carregar_* (que usam as 'leituras').
+    São dois pools separados para um carregador nunca ficar esperando numa fila ocupada por ele mesmo.
+    """
+    return {
+        "limitador": LimitadorCota(COTA_LEITURAS_POR_MINUTO * 0.9, RAJADA_MAXIMA_LEITURAS),
+        "limitador_escrita": LimitadorCota(COTA_ESCRITAS_POR_MINUTO * 0.9, RAJADA_MAXIMA_LEITURAS),
+        "leituras": ThreadPoolExecutor(max_workers=MAX_LEITURAS_SIMULTANEAS, thread_name_prefix="leitura_sheets"),
+        "carregadores": ThreadPoolExecutor(max_workers=MAX_LEITURAS_SIMULTANEAS, thread_name_prefix="carregador_dados")
+    }
+
+def erro_de_cota(erro):
+    msg = str(erro).lower()
+    return "429" in msg or "quota exceeded" in msg or "rate limit" in msg
+
+def tempo_retry_after(erro):
+    """Lê o cabeçalho Retry-After da resposta do Google (em segundos), se existir."""
+    resposta = getattr(erro, "response", None)
+    cabecalhos = getattr(resposta, "headers", None) or {}
+    try:
+        return float(cabecalhos.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def calcular_espera_retentativa(tentativa, espera_base):
+    """Metade fixa + metade sorteada, para as sessões não voltarem todas no mesmo segundo."""
+    exponencial = min(ESPERA_MAXIMA_RETENTATIVA, espera_base * (2 ** tentativa))
+    return exponencial / 2 + random.uniform(0, exponencial / 2)
+
+def executar_com_retentativa(operacao, tentativas=5, espera=1, limitador=None, deve_repetir=None, so_cota=False, prazo_maximo=None):
+    """
+    Agendador de retentativas compartilhado por leituras e escritas.
+    - Espera exponencial com sorteio (jitter) entre as tentativas.
+    - Em erro de cota, respeita o Retry-After e pausa o limitador do processo inteiro,
+      então as outras sessões entram na fila em vez de martelar a API ao mesmo tempo.
+    - so_cota=True: só repete erros de cota (o Google recusou, então repetir não duplica nada).
+    - prazo_maximo: tempo total (segundos) que quem chamou aceita esperar; se a próxima espera
+      passar do prazo, desiste na hora em vez de dormir.
+    Se todas as tentativas falharem, levanta o último erro.
+    """
+    if limitador is None:
+        limitador = obter_motor_leitura()["limitador"]
+    inicio = time.monotonic()
+    for i in range(tentativas):
+        try:
+            return operacao()
+        except Exception as e:
+            cota = erro_de_cota(e)
+            if i == tentativas - 1 or (so_cota and not cota) or (deve_repetir is not None and not deve_repetir(e)):
+                raise
+            if cota:
+                atraso = calcular_espera_retentativa(i, espera * 2)
+                atraso = max(atraso, tempo_retry_after(e) or 0)
+                limitador.pausar(atraso)
+            else:
+                atraso = calcular_espera_retentativa(i, espera)
+            if prazo_maximo is not None and time.monotonic() - inicio + atraso > prazo_maximo:
+                raise
+            time.sleep(atraso)
+
+# ==============================================================================
+# CACHE DE PLANILHAS E ABAS ("Endereços já resolvidos")
+# ==============================================================================
+
+@st.cache_resource(show_spinner=False)
+def obter_cache_planilhas():
+    """
+    Guarda, para o processo inteiro, os objetos Spreadsheet (por URL) e Worksheet (por URL + aba).
+    Assim o open_by_url e o worksheet() (duas chamadas de metadados) só acontecem uma vez,
+    e não a cada leitura/escrita.
+    """
+    return {"planilhas": {}, "abas": {}, "lock": threading.Lock()}
+
+def obter_planilha(url):
+    cache = obter_cache_planilhas()
+    with cache["lock"]:
+        planilha = cache["planilhas"].get(url)
+    if planilha is None:
+        obter_motor_leitura()["limitador"].adquirir() # open_by_url
+        planilha = get_gspread_client_cached().open_by_url(url)
+        with cache["lock"]:
+            cache["planilhas"][url] = planilha
+    return planilha
+
+def obter_aba(url, aba):
+    cache = obter_cache_planilhas()
+    with cache["lock"]:
+        worksheet = cache["abas"].get((url, aba))
+    if worksheet is None:
+        planilha = obter_planilha(url)
+        # Uma única chamada de metadados resolve TODAS as abas da planilha de uma vez
+        obter_motor_leitura()["limitador"].adquirir() # worksheets()
+        todas_abas = planilha.worksheets()
+        with cache["lock"]:
+            for ws in todas_abas:
+                cache["abas"][(url, ws.title)] = ws
+            worksheet = cache["abas"].get((url, aba))
+        if worksheet is None:
+            raise gspread.exceptions.WorksheetNotFound(aba)
+    return worksheet
+
+def aba_inexistente(erro):
+    """Identifica erro de aba apagada/renomeada (ou planilha inexistente)."""
+    if isinstance(erro, (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound)):
+        return True
+    msg = str(erro).lower()
+    return "unable to parse range" in msg or "requested entity was not found" in msg
+
+def invalidar_aba(url, aba):
+    """Esquece o endereço guardado; a próxima chamada resolve a planilha e as abas de novo."""
+    cache = obter_cache_planilhas()
+    with cache["lock"]:
+        cache["abas"].pop((url, aba), None)
+        cache["planilhas"].pop(url, None)
+
+# ==============================================================================
+# BACKEND DE ARMAZENAMENTO (GOOGLE SHEETS OU SQLITE LOCAL)
+# ==============================================================================
+
+# Escolha do backend por variável de ambiente:
+#   PAINEL_BACKEND=sheets (padrão) -> planilhas reais do Google
+#   PAINEL_BACKEND=sqlite          -> arquivo local (PAINEL_SQLITE_PATH), para testes e medições sem gastar cota
+# Para encher o arquivo local: python benchmark_painel.py --semear-sqlite painel_local.sqlite3
+# (dados sintéticos) e/ou --importar-csv SISTEMA Dados_Carteira carteira.csv (exportação da planilha).
+BACKEND_DADOS = os.environ.get("PAINEL_BACKEND", "sheets").strip().lower()
+CAMINHO_SQLITE = os.environ.get("PAINEL_SQLITE_PATH", "painel_local.sqlite3")
+
+class BackendGoogleSheets:
+    """
+    Operações brutas no Google Sheets (uma chamada por método, sem retentativa).
+    As retentativas ficam com quem chama (executar_com_retentativa); aqui só
+    consumimos as fichas da cota e esquecemos o endereço de abas que sumiram.
+    Todas as leituras devolvem listas de linhas (como o get_all_values).
+    """
+    def __init__(self):
+        self.motor = obter_motor_leitura()
+
+    def _na_aba(self, url, aba, operacao, fichas=1, escrita=False):
+        try:
+            worksheet = obter_aba(url, aba) # Endereço já resolvido (cache)
+            self.motor["limitador_escrita" if escrita else "limitador"].adquirir(fichas)
+            return operacao(worksheet)
+        except Exception as e:
+            # Aba sumiu/renomeou: descarta o endereço guardado e resolve de novo na próxima tentativa
+            if aba_inexistente(e):
+                invalidar_aba(url, aba)
+            raise
+
+    def ler_aba(self, url, aba):
+        return self._na_aba(url, aba, lambda ws: ws.get_all_values())
+
+    def ler_abas(self, url, abas):
+        # Nomes de abas com espaço/parênteses precisam de aspas simples no range
+        ranges = ["'" + aba.replace("'", "''") + "'" for aba in abas]
+        try:
+            sheet = obter_planilha(url)
+            self.motor["limitador"].adquirir() # values_batch_get
+            resposta = sheet.values_batch_get(ranges)
+        except Exception as e:
+            if aba_inexistente(e):
+                for aba in abas: invalidar_aba(url, aba)
+            raise
+        # O batchGet corta as células vazias do fim da linha; completamos como o get_all_values
+        return [gspread.utils.fill_gaps(bloco.get("values", [])) for bloco in resposta.get("valueRanges", [])]
+
+    def anexar_linhas(self, url, aba, linhas):
+        self._na_aba(url, aba, lambda ws: ws.append_rows(linhas, value_input_option="USER_ENTERED"), escrita=True)
+
+    def sobrescrever_aba(self, url, aba, linhas):
+        def gravar(ws):
+            ws.clear()
+            ws.update(linhas, value_input_option="USER_ENTERED")
+        self._na_aba(url, aba, gravar, fichas=2, escrita=True) # clear + update
+
+    def atualizar_intervalo(self, url, aba, intervalo, valores):
+        self._na_aba(url, aba, lambda ws: ws.update(range_name=intervalo, values=valores, value_input_option="USER_ENTERED"), escrita=True)
+
+    def ler_celula(self, url, aba, celula):
+        return self._na_aba(url, aba, lambda ws: ws.acell(celula).value)
+
+class BackendSQLite:
+    """
+    Substituto local do Google Sheets: cada aba vira um conjunto de linhas numa tabela SQLite,
+    com a linha 1 sendo o cabeçalho (igual à planilha). Os valores voltam sempre como texto,
+    como no get_all_values. Aba que não existe é lida como vazia.
+    Os dados entram pelo importar_csv / importar_dataframe (ver benchmark_painel.py --semear-sqlite).
+    """
+    NOMES_PLANILHAS = {URL_SISTEMA: "SISTEMA", URL_PINHEIRAL: "PINHEIRAL", URL_BICAS: "BICAS"}
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock() # Uma escrita por vez no arquivo
+        with self._conectar() as conexao:
+            conexao.execute("CREATE TABLE IF NOT EXISTS abas (planilha TEXT, aba TEXT, linha INTEGER, valores TEXT, "
+                            "PRIMARY KEY (planilha, aba, linha))")
+
+    @contextlib.contextmanager
+    def _conectar(self):
+        """Conexão curta: confirma (ou desfaz, se der erro) e FECHA no fim do bloco."""
+        with contextlib.closing(sqlite3.connect(self.caminho, timeout=30)) as conexao:
+            with conexao:
+                yield conexao
+
+    def _planilha(self, url):
+        return self.NOMES_PLANILHAS.get(url, url)
+
+    @staticmethod
+    def _texto(valor):
+        # Mesmo efeito do USER_ENTERED: o apóstrofo inicial só serve para forçar texto
+        if valor is None or (isinstance(valor, float) and valor != valor): return ""
+        texto = str(valor)
+        return texto[1:] if texto.startswith("'") else texto
+
+    def _linhas(self, conexao, url, aba):
+        cursor = conexao.execute("SELECT linha, valores FROM abas WHERE planilha = ? AND aba = ? ORDER BY linha",
+                                 (self._planilha(url), aba))
+        return {linha: json.loads(valores) for linha, valores in cursor}
+
+    def _gravar_linhas(self, conexao, url, aba, linhas):
+        conexao.executemany("INSERT OR REPLACE INTO abas (planilha, aba, linha, valores) VALUES (?, ?, ?, ?)",
+                            [(self._planilha(url), aba, n, json.dumps([self._texto(v) for v in valores])) for n, valores in linhas])
+
+    def ler_aba(self, url, aba):
+        with self._conectar() as conexao:
+            linhas = self._linhas(conexao, url, aba)
+        if not linhas: return []
+        # Completa linhas curtas e buracos (linhas em branco), como a planilha faz
+        largura = max(len(valores) for valores in linhas.values())
+        return [linhas.get(n, []) + [""] * (largura - len(linhas.get(n, []))) for n in range(1, max(linhas) + 1)]
+
+    def ler_abas(self, url, abas):
+        return [self.ler_aba(url, aba) for aba in abas]
+
+    def anexar_linhas(self, url, aba, linhas):
+        with self.lock, self._conectar() as conexao:
+            ultima = conexao.execute("SELECT COALESCE(MAX(linha), 0) FROM abas WHERE planilha = ? AND aba = ?",
+                                     (self._planilha(url), aba)).fetchone()[0]
+            self._gravar_linhas(conexao, url, aba, enumerate(linhas, start=ultima + 1))
+
+    def sobrescrever_aba(self, url, aba, linhas):
+        with self.lock, self._conectar() as conexao:
+            conexao.execute("DELETE FROM abas WHERE planilha = ? AND aba = ?", (self._planilha(url), aba))
+            self._gravar_linhas(conexao, url, aba, enumerate(linhas, start=1))
+
+    def atualizar_intervalo(self, url, aba, intervalo, valores):
+        linha_inicial, coluna_inicial = gspread.utils.a1_to_rowcol(intervalo.split(":")[0])
+        with self.lock, self._conectar() as conexao:
+            existentes = self._linhas(conexao, url, aba)
+            novas = []
+            for i, valores_linha in enumerate(valores):
+                n = linha_inicial + i
+                linha = list(existentes.get(n, []))
+                linha += [""] * (coluna_inicial - 1 + len(valores_linha) - len(linha))
+                linha[coluna_inicial - 1:coluna_inicial - 1 + len(valores_linha)] = valores_linha
+                novas.append((n, linha))
+            self._gravar_linhas(conexao, url, aba, novas)
+
+    def importar_dataframe(self, url, aba, df):
+        """Substitui a aba pelo DataFrame (cabeçalho + linhas). 'url' pode ser o nome: SISTEMA, PINHEIRAL, BICAS."""
+        self.sobrescrever_aba(url, aba, [list(df.columns)] + df.values.tolist())
+
+    def importar_csv(self, url, aba, caminho_csv):
+        """Substitui a aba pelo conteúdo de um CSV exportado do Google Sheets (Arquivo > Fazer download > CSV)."""
+        with open(caminho_csv, newline="", encoding="utf-8-sig") as arquivo:
+            self.sobrescrever_aba(url, aba, list(csv.reader(arquivo)))
+
+    def ler_celula(self, url, aba, celula):
+        linha, coluna = gspread.utils.a1_to_rowcol(celula)
+        with self._conectar() as conexao:
+            resultado = conexao.execute("SELECT valores FROM abas WHERE planilha = ? AND aba = ? AND linha = ?",
+                                        (self._planilha(url), aba, linha)).fetchone()
+        valores = json.loads(resultado[0]) if resultado else []
+        return valores[coluna - 1] if coluna <= len(valores) and valores[coluna - 1] != "" else None
+
+@st.cache_resource(show_spinner=False)
+def obter_backend():
+    if BACKEND_DADOS == "sqlite":
+        return BackendSQLite(CAMINHO_SQLITE)
+    return BackendGoogleSheets()
+
 # ==============================================================================
 # LEITURA E ESCRITA (COM TRATAMENTO DE ERRO "SINALIZADO")
 # ==============================================================================
 
-def ler_com_retry(url, aba, tentativas=5, espera=1):
+def ler_com_retry(url, aba, tentativas=5, espera=1, prazo_maximo=None):
     """
     Tenta ler os dados.
     - Se sucesso: Retorna DataFrame.
     - Se erro de conexão (429/Timeout): Retorna None (Sinal para usar cache).
     - Se vazio: Retorna DataFrame vazio.
     """
-    client = get_gspread_client_cached()
-    for i in range(tentativas):
-        try:
-            sheet = client.open_by_url(url)
-            worksheet = sheet.worksheet(aba)
-            data = worksheet.get_all_values()
-            if data and len(data) > 0:
-                return pd.DataFrame(data[1:], columns=data[0])
-            else:
-                return pd.DataFrame()
-        except Exception as e:
-            # Se for erro de cota, espera mais tempo
-            msg = str(e).lower()
-            if "429" in msg or "quota exceeded" in msg:
-                time.sleep(espera * 2)
-            else:
-                time.sleep(espera)
-            
-            # Se falhar na última tentativa, retorna None (Erro Crítico de Conexão)
-            if i == tentativas - 1:
-                return None
-    return None
+    limitador = obter_motor_leitura()["limitador"]
+    backend = obter_backend()
+
+    try:
+        data = executar_com_retentativa(lambda: backend.ler_aba(url, aba), tentativas, espera, limitador, prazo_maximo=prazo_maximo)
+    except Exception:
+        # Falhou em todas as tentativas: retorna None (Erro Crítico de Conexão)
+        return None
+    if data and len(data) > 0:
+        return pd.DataFrame(data[1:], columns=data[0])
+    return pd.DataFrame()
+
+def ler_abas_em_lote(url, abas, tentativas=5, espera=1):
+    """
+    Lê VÁRIAS abas da mesma planilha em UMA chamada (values.batchGet).
+    Retorna um dicionário {aba: DataFrame}, seguindo o mesmo sinal do ler_com_retry:
+    - Aba com dados: DataFrame / Aba vazia: DataFrame vazio.
+    - Erro de conexão (429/Timeout): None na aba (Sinal para usar cache).
+    """
+    limitador = obter_motor_leitura()["limitador"]
+    backend = obter_backend()
+
+    # Uma aba inexistente derruba o lote inteiro: não adianta repetir o lote
+    def lote_recuperavel(erro):
+        return "unable to parse range" not in str(erro).lower()
 
-def escrever_no_sheets(url, aba, df_novo, modo="append"):
     try:
-        client = get_gspread_client_cached() # Usa a conexão rápida
-        sheet = client.open_by_url(url)
-        worksheet = sheet.worksheet(aba)
-        if modo == "overwrite":
-            worksheet.clear()
-            dados = [df_novo.columns.values.tolist()] + df_novo.values.tolist()
-            worksheet.update(dados, value_input_option="USER_ENTERED")
+        blocos = executar_com_retentativa(lambda: backend.ler_abas(url, abas), tentativas, espera, limitador, deve_repetir=lote_recuperavel)
+    except Exception as e:
+        if not lote_recuperavel(e):
+            # Cai para a leitura aba por aba (as abas que existem continuam vindo)
+            return {aba: ler_com_retry(url, aba, tentativas=tentativas, espera=espera) for aba in abas}
+        return {aba: None for aba in abas}
+
+    resultado = {}
+    for aba, data in zip(abas, blocos):
+        if data and len(data) > 0:
+            resultado[aba] = pd.DataFrame(data[1:], columns=data[0])
         else:
-            dados = df_novo.values.tolist()
-            worksheet.append_rows(dados, value_input_option="USER_ENTERED")
+            resultado[aba] = pd.DataFrame()
+    return resultado
+
+def gravar_no_backend(url, aba, df_novo, modo="append", tentativas=4):
+    """Grava de fato e LEVANTA o erro se não conseguir (quem precisa saber o motivo usa esta)."""
+    backend = obter_backend()
+    limitador_escrita = obter_motor_leitura()["limitador_escrita"]
+    if modo == "overwrite":
+        dados = [df_novo.columns.values.tolist()] + df_novo.values.tolist()
+        gravar = lambda: backend.sobrescrever_aba(url, aba, dados)
+    else:
+        dados = df_novo.values.tolist()
+        gravar = lambda: backend.anexar_linhas(url, aba, dados)
+    # Só repete se o Google recusou por cota (nada foi gravado, então não duplica linhas)
+    executar_com_retentativa(gravar, tentativas=tentativas, limitador=limitador_escrita, so_cota=True)
+
+def escrever_no_sheets(url, aba, df_novo, modo="append"):
+    try:
+        gravar_no_backend(url, aba, df_novo, modo)
         return True
-    except:
+    except Exception:
         return False
 
+def erro_sem_gravacao(erro):
+    """
+    Erros em que com certeza NADA foi gravado, então reenviar não duplica linhas:
+    cota, conexão recusada/não aberta, SQLite ocupado (a transação nem começou).
+    Timeout e 5xx ficam de fora: o append_rows pode ter chegado ao Google mesmo assim.
+    """
+    if erro_de_cota(erro) or isinstance(erro, ConnectionRefusedError):
+        return True
+    msg = str(erro).lower()
+    if isinstance(erro, RequestException):
+        return any(marca in msg for marca in ["connection refused", "failed to establish a new connection"])
+    return "database is locked" in msg
+
 # ==============================================================================
-# 2. FUNÇÃO DE BLINDAGEM DE DADOS ("Memória Persistente")
+# FILA DE GRAVAÇÃO EM SEGUNDO PLANO ("Anota Agora, Grava Depois")
+# ==============================================================================
+
+INTERVALO_GRAVACAO_FILA = 3 # segundos entre cada descarga da fila
+MAX_TENTATIVAS_FILA = 6     # envios de um mesmo lote antes de desistir dele
+ESPERA_MAXIMA_FILA = 120    # teto (segundos) da espera entre reenvios de um lote que falhou
+MAX_DESCARTADOS_FILA = 200  # lotes descartados guardados para o admin ver
+
+class FilaGravacao:
+    """
+    Fila única do processo para as gravações do tipo "append" que ninguém fica esperando (acessos, ciência de avisos).
+    Solicitações (acesso, fotos, certificados, notas) continuam gravando na hora: a tela só confirma o que já está na planilha.
+    Quem grava recebe a confirmação na hora; a cada poucos segundos uma thread junta
+    todas as linhas pendentes de cada aba e envia num único append_rows.
+    Se o Google recusar sem gravar nada (cota, conexão recusada), as linhas voltam para a fila (na
+    mesma ordem) e são reenviadas com espera crescente, até MAX_TENTATIVAS_FILA envios. Qualquer
+    outro erro (timeout e 5xx podem ter gravado; aba apagada, 400...) ou tentativas esgotadas:
+    o lote vai para 'descartados' e para o log, sem reenviar linhas que talvez já estejam lá.
+    """
+    def __init__(self):
+        self.pendentes = {} # (url, aba) -> {"linhas": [...], "ao_gravar": [...], "tentativas": n, "proxima": horário}
+        self.descartados = [] # [{"quando", "aba", "linhas", "erro"}], os mais recentes no fim
+        self.lock = threading.Lock()
+        self.lock_descarga = threading.Lock()
+        self.thread = threading.Thread(target=self.executar, name="fila_gravacao", daemon=True)
+        self.thread.start()
+        # Ao desligar o servidor, grava o que ainda estiver na fila (sem esperar o horário de reenvio)
+        atexit.register(self.descarregar, True)
+
+    @staticmethod
+    def lote_vazio():
+        return {"linhas": [], "ao_gravar": [], "tentativas": 0, "proxima": 0}
+
+    def enfileirar(self, url, aba, linhas, ao_gravar=None):
+        with self.lock:
+            lote = self.pendentes.setdefault((url, aba), self.lote_vazio())
+            lote["linhas"].extend(linhas)
+            if ao_gravar is not None and ao_gravar not in lote["ao_gravar"]:
+                lote["ao_gravar"].append(ao_gravar)
+        return True
+
+    def devolver(self, url, aba, lote, tentativas, proxima):
+        """Põe o lote que falhou de volta no começo da fila, antes das linhas que chegaram depois."""
+        with self.lock:
+            novo = self.pendentes.get((url, aba), self.lote_vazio())
+            self.pendentes[(url, aba)] = {
+                "linhas": lote["linhas"] + novo["linhas"],
+                "ao_gravar": lote["ao_gravar"] + [f for f in novo["ao_gravar"] if f not in lote["ao_gravar"]],
+                "tentativas": tentativas,
+                "proxima": proxima,
+            }
+
+    def descartar(self, aba, lote, erro):
+        logging.getLogger(__name__).error("Fila de gravação: %d linha(s) da aba '%s' descartadas após %d envio(s): %s | %s",
+                                          len(lote["linhas"]), aba, lote["tentativas"] + 1, erro, lote["linhas"])
+        with self.lock:
+            self.descartados.append({"quando": datetime.now(FUSO_BR).strftime("%d/%m/%Y %H:%M:%S"), "aba": aba,
+                                     "linhas": lote["linhas"], "erro": str(erro)})
+            del self.descartados[:-MAX_DESCARTADOS_FILA]
+
+    def descarregar(self, forcar=False):
+        with self.lock_descarga: # Evita a thread e o atexit enviarem o mesmo lote juntos
+            agora = time.time()
+            with self.lock:
+                # Lote que falhou há pouco espera a vez dele (a não ser que seja uma descarga forçada)
+                prontos = {chave: lote for chave, lote in self.pendentes.items() if forcar or lote["proxima"] <= agora}
+                for chave in prontos: del self.pendentes[chave]
+            for (url, aba), lote in prontos.items():
+                try:
+                    # 2 tentativas aqui dentro: a espera longa entre reenvios é feita pela própria fila
+                    gravar_no_backend(url, aba, pd.DataFrame(lote["linhas"]), modo="append", tentativas=2)
+                except Exception as e:
+                    tentativas = lote["tentativas"] + 1
+                    if erro_sem_gravacao(e) and tentativas < MAX_TENTATIVAS_FILA:
+                        espera = min(ESPERA_MAXIMA_FILA, INTERVALO_GRAVACAO_FILA * 2 ** tentativas)
+                        self.devolver(url, aba, lote, tentativas, agora + espera)
+                    else:
+                        self.descartar(aba, lote, e)
+                    continue
+                for funcao in lote["ao_gravar"]:
+                    try: funcao()
+                    except Exception: pass
+
+    def situacao(self):
+        """Linhas ainda na fila por aba e os lotes descartados (para a tela do admin)."""
+        with self.lock:
+            pendentes = {aba: len(lote["linhas"]) for (_, aba), lote in self.pendentes.items()}
+            return pendentes, list(self.descartados)
+
+    def executar(self):
+        while True:
+            time.sleep(INTERVALO_GRAVACAO_FILA)
+            try:
+                self.descarregar()
+            except Exception:
+                pass
+
+@st.cache_resource(show_spinner=False)
+def obter_fila_gravacao():
+    return FilaGravacao()
+
+def enfileirar_no_sheets(url, aba, df_novo, ao_gravar=None):
+    """
+    Versão "append" do escrever_no_sheets que não espera o Google: coloca as linhas na fila
+    e retorna True na hora. 'ao_gravar' roda depois que as linhas foram de fato gravadas
+    (ex.: limpar o cache da aba).
+    """
+    return obter_fila_gravacao().enfileirar(url, aba, df_novo.values.tolist(), ao_gravar)
+
+def descarregar_fila_gravacao():
+    """Força o envio imediato de tudo que está na fila (também roda sozinho ao desligar)."""
+    obter_fila_gravacao().descarregar()
+
+# ==============================================================================
+# 2. ATUALIZAÇÃO EM SEGUNDO PLANO ("Foto Pronta")
+# ==============================================================================
+
+# De quanto em quanto tempo (segundos) cada conjunto é recarregado em segundo plano.
+# Mesmo valor do ttl do @st.cache_data de cada função, para a recarga sempre buscar dado novo.
+INTERVALOS_ATUALIZACAO = {
+    "carregar_usuarios": 1800,
+    "carregar_status_robo": 120,
+    "carregar_dados_credito": 300,
+    "carregar_dados_carteira": 300,
+    "carregar_dados_titulos": 300,
+    "carregar_dados_manutencao": 60,
+    "carregar_dados_pedidos": 900,
+}
+INTERVALO_ATUALIZACAO_PADRAO = 600
+
+# Conjuntos que só o robô grava. O robô carimba o Status_Robo a cada sincronização (~20 min),
+# então se o carimbo não mudou desde a última foto, a planilha também não mudou.
+DATASETS_DO_ROBO = ["carregar_dados_credito", "carregar_dados_carteira", "carregar_estoque"]
+INTERVALO_VOLTA_ATUALIZADOR = 15   # O atualizador confere a fila a cada 15s
+TEMPO_OCIOSO_MAXIMO = 1800         # Conjunto que ninguém abre há 30 min para de ser recarregado
+FATOR_IDADE_MAXIMA = 2             # Foto com mais de 2 intervalos é lida de novo na hora, não servida
+
+# Cópia em disco (Parquet) de cada foto: sobrevive a reinícios do servidor e serve de
+# reserva quando o Google está fora do ar.
+DIRETORIO_SNAPSHOTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_painel")
+# Conjuntos que nunca vão para o disco (a aba Usuarios tem as senhas)
+DATASETS_SEM_DISCO = ["carregar_usuarios"]
+
+def salvar_snapshot_disco(nome, snapshot):
+    """Grava a foto em <nome>.parquet + <nome>.json (versão e horário). Falha em silêncio."""
+    try:
+        os.makedirs(DIRETORIO_SNAPSHOTS, exist_ok=True)
+        base = os.path.join(DIRETORIO_SNAPSHOTS, nome)
+        # Grava em arquivo temporário e troca no final: quem ler nunca pega arquivo pela metade
+        snapshot["df"].to_parquet(base + ".parquet.tmp")
+        with open(base + ".json.tmp", "w", encoding="utf-8") as arquivo:
+            json.dump({"versao": snapshot["versao"], "atualizado_em": snapshot["atualizado_em"],
+                       "marca_robo": snapshot.get("marca_robo"), "linhas": len(snapshot["df"])}, arquivo)
+        os.replace(base + ".parquet.tmp", base + ".parquet")
+        os.replace(base + ".json.tmp", base + ".json")
+    except Exception:
+        pass # Ex.: colunas repetidas/sem nome não cabem em Parquet; fica só a foto em memória
+
+def ler_manifesto_disco(nome):
+    """Retorna o <nome>.json (versão, horário, linhas) da foto em disco, ou None se não houver."""
+    try:
+        with open(os.path.join(DIRETORIO_SNAPSHOTS, nome) + ".json", encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except Exception:
+        return None
+
+def ler_snapshot_disco(nome):
+    """Retorna (df, manifesto) da última foto gravada em disco, ou None se não houver."""
+    manifesto = ler_manifesto_disco(nome)
+    if manifesto is None: return None
+    try:
+        return pd.read_parquet(os.path.join(DIRETORIO_SNAPSHOTS, nome) + ".parquet"), manifesto
+    except Exception:
+        return None
+
+def foto_vencida(nome, snapshot):
+    """
+    True se a foto passou da idade máxima do conjunto: ficou sem ninguém olhando (o atualizador
+    parou de recarregar) ou veio de uma cópia antiga do disco.
+    """
+    intervalo = INTERVALOS_ATUALIZACAO.get(nome, INTERVALO_ATUALIZACAO_PADRAO)
+    return time.time() - snapshot["atualizado_em"] > FATOR_IDADE_MAXIMA * intervalo
+
+class AtualizadorDados:
+    """
+    Serviço único do processo (criado uma vez via st.cache_resource).
+    Guarda a última "foto" (snapshot) de cada conjunto de dados e, numa thread própria,
+    recarrega cada conjunto no seu intervalo e publica a foto nova de uma vez só.
+    As telas sempre leem a foto pronta: nenhum clique fica esperando o Google.
+    """
+    def __init__(self):
+        self.snapshots = {}    # nome -> {"df", "versao", "atualizado_em", "marca_robo"}
+        self.registrados = {}  # nome -> {"funcao", "intervalo", "ultimo_uso"}
+        self.contador_versao = 0
+        self.restaurados = set()  # Conjuntos que já tentaram voltar do disco neste processo
+        self.lock = threading.Lock()
+        self.lock_disco = threading.Lock()
+        self.thread = threading.Thread(target=self.executar, name="atualizador_dados", daemon=True)
+        self.thread.start()
+
+    def ler_snapshot(self, nome):
+        with self.lock:
+            return self.snapshots.get(nome)
+
+    def publicar(self, nome, df, marca_robo=None):
+        """Troca a foto do conjunto. Se o conteúdo não mudou, só renova o horário (mantém a versão)."""
+        with self.lock:
+            atual = self.snapshots.get(nome)
+        mesmo_conteudo = atual is not None and atual["df"].equals(df)
+        with self.lock:
+            if mesmo_conteudo:
+                self.snapshots[nome] = dict(atual, atualizado_em=time.time(), marca_robo=marca_robo)
+                return self.snapshots[nome]
+            self.contador_versao += 1
+            snapshot = {"df": df, "versao": self.contador_versao, "atualizado_em": time.time(), "marca_robo": marca_robo}
+            self.snapshots[nome] = snapshot
+        # A cópia em disco é gravada fora da tela de quem pediu
+        obter_motor_leitura()["carregadores"].submit(self.gravar_no_disco, nome, snapshot)
+        return snapshot
+
+    def gravar_no_disco(self, nome, snapshot):
+        if nome in DATASETS_SEM_DISCO: return
+        if snapshot["df"].empty:
+            # Tabela vazia não apaga a reserva: se o disco tem linhas, é delas que vamos precisar
+            # quando o Google cair (manifesto antigo, sem "linhas", conta como reserva com dados)
+            manifesto = ler_manifesto_disco(nome)
+            if manifesto is not None and manifesto.get("linhas", 1) > 0: return
+        with self.lock_disco:
+            if self.ler_snapshot(nome) is snapshot: # Já existe foto mais nova: não grava a velha por cima
+                salvar_snapshot_disco(nome, snapshot)
+
+    def restaurar(self, nome):
+        """
+        Publica a foto gravada em disco (reinício do servidor ou Google fora do ar).
+        Mantém o horário original, então o atualizador busca o dado novo assim que vencer.
+        """
+        with self.lock:
+            self.restaurados.add(nome)
+        if nome in DATASETS_SEM_DISCO: return None
+        salvo = ler_snapshot_disco(nome)
+        if salvo is None: return None
+        df, manifesto = salvo
+        with self.lock:
+            if nome in self.snapshots: return self.snapshots[nome]
+            self.contador_versao += 1
+            self.snapshots[nome] = {"df": df, "versao": self.contador_versao,
+                                    "atualizado_em": manifesto.get("atualizado_em", 0),
+                                    "marca_robo": manifesto.get("marca_robo")}
+            return self.snapshots[nome]
+
+    def ja_restaurado(self, nome):
+        with self.lock:
+            return nome in self.restaurados
+
+    def renovar(self, nome):
+        """A planilha não mudou: a foto atual vale por mais um intervalo, sem baixar nada."""
+        with self.lock:
+            if nome in self.snapshots:
+                self.snapshots[nome] = dict(self.snapshots[nome], atualizado_em=time.time())
+
+    def descartar(self, nome=None):
+        """Joga fora a foto (de um conjunto ou de todos) para forçar leitura nova na próxima tela."""
+        with self.lock:
+            if nome is None: self.snapshots.clear()
+            else: self.snapshots.pop(nome, None)
+
+    def registrar(self, funcao):
+        nome = funcao.__name__
+        with self.lock:
+            if nome not in self.registrados:
+                intervalo = INTERVALOS_ATUALIZACAO.get(nome, INTERVALO_ATUALIZACAO_PADRAO)
+                self.registrados[nome] = {"funcao": funcao, "intervalo": intervalo, "ultimo_uso": time.time()}
+            else:
+                self.registrados[nome]["ultimo_uso"] = time.time()
+
+    def recarregar(self, nome, funcao, marca_robo=None):
+        if nome in DATASETS_DO_ROBO and marca_robo is not None:
+            snapshot = self.ler_snapshot(nome)
+            if snapshot is not None and snapshot.get("marca_robo") == marca_robo:
+                self.renovar(nome)
+                return
+            # O robô gravou de novo: ignora o cache do Streamlit e baixa a planilha
+            if hasattr(funcao, "clear"): funcao.clear()
+        dados_novos = funcao()
+        if dados_novos is not None: # None = erro de conexão: mantém a foto antiga
+            self.publicar(nome, dados_novos, marca_robo if nome in DATASETS_DO_ROBO else None)
+
+    def executar(self):
+        while True:
+            time.sleep(INTERVALO_VOLTA_ATUALIZADOR)
+            agora = time.time()
+            with self.lock:
+                # Para de recarregar o que ninguém está olhando
+                for nome in [n for n, r in self.registrados.items() if agora - r["ultimo_uso"] > TEMPO_OCIOSO_MAXIMO]:
+                    del self.registrados[nome]
+                vencidos = []
+                for nome, registro in self.registrados.items():
+                    snapshot = self.snapshots.get(nome)
+                    if snapshot is None or agora - snapshot["atualizado_em"] >= registro["intervalo"]:
+                        vencidos.append((nome, registro["funcao"]))
+            # Sonda barata (uma aba de 1 linha) antes de baixar as planilhas grandes do robô
+            marca_robo = None
+            if any(nome in DATASETS_DO_ROBO for nome, _ in vencidos):
+                try:
+                    marca_robo = ler_marca_robo()
+                except Exception:
+                    pass
+            for nome, funcao in vencidos:
+                try:
+                    self.recarregar(nome, funcao, marca_robo)
+                except Exception:
+                    pass # Tenta de novo na próxima volta
+
+def ler_marca_robo():
+    """
+    Lê o carimbo 'Ultima_Atualizacao' da aba Status_Robo direto do Google (sem cache).
+    Retorna None se não conseguir ler; nesse caso os conjuntos são baixados normalmente.
+    """
+    df = ler_com_retry(URL_SISTEMA, "Status_Robo", tentativas=2, espera=1)
+    if df is None or df.empty or 'Ultima_Atualizacao' not in df.columns: return None
+    marca = str(df.iloc[0]['Ultima_Atualizacao']).strip()
+    return marca or None
+
+@st.cache_resource(show_spinner=False)
+def obter_atualizador():
+    return AtualizadorDados()
+
+def recarregar_dados(*funcoes_carregamento):
+    """
+    Usado pelos botões "Atualizar" e depois de gravar algo: limpa o cache do Streamlit
+    e descarta a foto, para a próxima tela buscar o dado novo na hora.
+    """
+    atualizador = obter_atualizador()
+    for funcao in funcoes_carregamento:
+        if hasattr(funcao, "clear"): funcao.clear()
+        atualizador.descartar(funcao.__name__)
+
+# ==============================================================================
+# 3. FUNÇÃO DE BLINDAGEM DE DADOS ("Memória Persistente")
 # ==============================================================================
 
 def obter_dados_persistentes(chave_sessao, funcao_carregamento):
     """
-    Tenta buscar dados novos.
+    Entrega a última foto do conjunto (publicada pelo atualizador em segundo plano).
+    Só na primeira vez do processo é que a leitura acontece na hora.
     Se der erro de conexão (None), retorna SILENCIOSAMENTE os dados antigos 
     que já estavam na memória, sem mostrar erro para o usuário.
     """
     # 1. Garante que a memória existe (mesmo que vazia no início)
     if chave_sessao not in st.session_state:
         st.session_state[chave_sessao] = pd.DataFrame()
+
+    atualizador = obter_atualizador()
+    nome = funcao_carregamento.__name__
+    atualizador.registrar(funcao_carregamento)
+
+    # 2. Usa a foto pronta; se ainda não existe, tenta a cópia em disco (servidor acabou de subir)
+    # e só então carrega agora. Depois de um "Atualizar", o disco só entra se o Google falhar.
+    # Foto velha demais (ninguém abriu o conjunto por um tempo) também é lida na hora:
+    # a velha só é entregue se o Google falhar.
+    snapshot = atualizador.ler_snapshot(nome)
+    if snapshot is None and not atualizador.ja_restaurado(nome):
+        snapshot = atualizador.restaurar(nome)
+    if snapshot is None or foto_vencida(nome, snapshot):
+        dados_novos = funcao_carregamento()
+        if dados_novos is not None:
+            snapshot = atualizador.publicar(nome, dados_novos)
+        elif snapshot is None:
+            snapshot = atualizador.restaurar(nome)
     
-    # 2. Tenta carregar dados novos
-    dados_novos = funcao_carregamento()
-    
-    # 3. Se veio dado válido (mesmo que tabela vazia, mas conexão OK), atualiza a memória
-    if dados_novos is not None:
-        st.session_state[chave_sessao] = dados_novos
+    # 3. Se veio dado válido (mesmo que tabela vazia, mas conexão OK), atualiza a memória.
+    # A foto é compartilhada entre sessões: cada tela recebe uma cópia rasa (colunas novas não vazam)
+    if snapshot is not None:
+        st.session_state[chave_sessao] = snapshot["df"].copy(deep=False)
+        st.session_state.setdefault('versoes_dados', {})[nome] = snapshot["versao"]
     
-    # 4. Se dados_novos for None (Erro Conexão), ignora e retorna o antigo (Memória)
+    # 4. Se não há foto (Erro Conexão), ignora e retorna o antigo (Memória)
     return st.session_state[chave_sessao]
 
+# ==============================================================================
+# DADOS DERIVADOS ("Calcula Uma Vez por Versão")
+# ==============================================================================
+
+@st.cache_resource(show_spinner=False)
+def obter_cache_derivados():
+    """Cálculos feitos em cima de uma foto (índices, tabelas resumidas...), compartilhados por todas as sessões."""
+    return {"itens": {}, "lock": threading.Lock()}
+
+def versao_dados(funcao_carregamento):
+    """Versão da foto que ESTA sessão está usando (a mesma do DataFrame que ela recebeu)."""
+    return st.session_state.get('versoes_dados', {}).get(funcao_carregamento.__name__)
+
+def obter_derivado(funcao_carregamento, nome, construtor, dependencias=None):
+    """
+    Devolve construtor() calculado uma única vez por versão do conjunto de dados.
+    Quando o atualizador publica uma foto nova, a versão muda e o cálculo é refeito na próxima tela.
+    Sem versão (dados vindos só da memória da sessão), calcula na hora sem guardar.
+    'dependencias' (o dia, a versão de outro conjunto...) é comparado junto com a versão, e não
+    entra na chave: assim cada 'nome' guarda um item só e nada se acumula com o passar dos dias.
+    """
+    versao = versao_dados(funcao_carregamento)
+    if versao is None: return construtor()
+    if dependencias is not None: versao = (versao, dependencias)
+    chave = (funcao_carregamento.__name__, nome)
+    cache = obter_cache_derivados()
+    with cache["lock"]:
+        item = cache["itens"].get(chave)
+    if item is not None and item[0] == versao:
+        return item[1]
+    valor = construtor()
+    with cache["lock"]:
+        cache["itens"][chave] = (versao, valor) # Só a versão mais recente fica guardada
+    return valor
+
+class IndiceUsuarios:
+    """
+    Índice de uma coluna de nomes (VENDEDOR, GERENTE...) para o filtro por usuário.
+    Os nomes são normalizados (minúsculo, sem espaços nas pontas) uma vez só, e cada busca
+    compara o filtro só com os nomes DISTINTOS; o resultado de cada filtro fica memorizado.
+    """
+    def __init__(self, serie):
+        self.codigos, self.nomes = pd.factorize(serie.astype(str).str.strip().str.lower())
+        self.index = serie.index
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def mascara(self, nome_busca, index=None):
+        """Linhas cujo nome CONTÉM o filtro. 'index' recorta para um DataFrame já filtrado."""
+        nome_busca = str(nome_busca).strip().lower()
+        with self.lock:
+            linhas = self.memo.get(nome_busca)
+        if linhas is None:
+            casam = [i for i, nome in enumerate(self.nomes) if nome_busca in nome]
+            linhas = pd.Series(self.codigos, index=self.index).isin(casam)
+            with self.lock:
+                self.memo[nome_busca] = linhas
+        return linhas if index is None else linhas.loc[index]
+
+class IndiceBusca:
+    """
+    Índice invertido para as caixas de busca (texto contido, sem diferenciar maiúsculas).
+    Cada coluna vira códigos (factorize) + valores distintos em minúsculo, e cada trigrama
+    (3 letras seguidas) aponta para os valores distintos que o contêm. A busca cruza as listas
+    dos trigramas do texto digitado, confere os candidatos e devolve as linhas que casam.
+    As colunas só são indexadas na primeira busca que precisar delas.
+    """
+    def __init__(self, df):
+        self.df = df
+        self.index = df.index
+        self.colunas = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def trigramas(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    def _coluna(self, coluna):
+        with self.lock:
+            if coluna not in self.colunas:
+                codigos, valores = pd.factorize(self.df[coluna].astype(str).str.lower())
+                listas = {}
+                for posicao, valor in enumerate(valores):
+                    for trigrama in self.trigramas(valor):
+                        listas.setdefault(trigrama, []).append(posicao)
+                self.colunas[coluna] = (codigos, valores, listas)
+            return self.colunas[coluna]
+
+    def buscar(self, texto, colunas=None, index=None):
+        """Máscara das linhas em que ALGUMA das colunas contém o texto. 'index' recorta para um DataFrame já filtrado."""
+        texto = str(texto).lower()
+        mascara = pd.Series(False, index=self.index)
+        for coluna in (colunas if colunas is not None else self.df.columns):
+            if coluna not in self.df.columns: continue
+            codigos, valores, listas = self._coluna(coluna)
+            if len(texto) >= 3:
+                # Começa pela lista mais curta: quase sempre sobram poucos candidatos
+                postings = sorted((listas.get(t, []) for t in self.trigramas(texto)), key=len)
+                candidatos = set(postings[0])
+                for lista in postings[1:]:
+                    if not candidatos: break
+                    candidatos &= set(lista)
+            else:
+                candidatos = range(len(valores))
+            casam = [i for i in candidatos if texto in valores[i]]
+            if casam:
+                mascara |= pd.Series(codigos, index=self.index).isin(casam)
+        return mascara if index is None else mascara.loc[index]
+
+def indices_usuarios(funcao_carregamento, df, colunas):
+    """Um IndiceUsuarios por coluna existente, montados uma vez por versão do conjunto."""
+    return obter_derivado(funcao_carregamento, "indices_usuarios",
+                          lambda: {col: IndiceUsuarios(df[col]) for col in colunas if col in df.columns})
+
+class DiretorioUsuarios:
+    """
+    Aba Usuarios indexada pelo login normalizado (sem espaços nas pontas, minúsculo).
+    O login vira uma consulta de dicionário, sem varrer e normalizar a tabela inteira a cada tentativa.
+    """
+    def __init__(self, df):
+        self.por_login = {}
+        for linha in df.to_dict('records'):
+            login = str(linha.get('Login', '')).strip().lower()
+            self.por_login.setdefault(login, []).append(linha) # Login repetido: vale a 1ª linha com a senha certa
+
+    def autenticar(self, login, senha):
+        """Linha do usuário (dict) se login e senha conferem, senão None."""
+        for linha in self.por_login.get(str(login).strip().lower(), []):
+            if str(linha.get('Senha', '')).strip() == senha:
+                return linha
+        return None
+
+def diretorio_usuarios(df):
+    """Diretório de login montado uma vez por versão da aba Usuarios e compartilhado pelo processo."""
+    return obter_derivado(carregar_usuarios, "diretorio_login", lambda: DiretorioUsuarios(df))
+
 # ==============================================================================
 # FUNÇÕES DE FEEDBACK
 # ==============================================================================
@@ -154,45 +1056,95 @@ def converte_numero_seguro(valor):
     except:
         return 0.0
 
+def converter_coluna_numerica(serie):
+    """
+    Mesmo resultado do converte_numero_seguro, mas na coluna inteira de uma vez
+    (operações de texto do pandas + to_numeric, sem laço em Python por célula).
+    "1.234,56" -> 1234.56 / vazio, "nan", "None" ou texto inválido -> 0.0
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float).fillna(0.0) # Já é número: só troca os vazios por 0
+    texto = serie.astype(str).str.strip()
+    # Com vírgula é formato brasileiro: ponto é milhar e vírgula é decimal
+    com_virgula = texto.str.contains(',', regex=False)
+    texto = texto.where(~com_virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(texto, errors='coerce').astype(float).fillna(0.0)
+
 def gerar_excel_formatado(df):
     output = io.BytesIO()
     
-    # Cria o arquivo Excel na memória usando o motor xlsxwriter
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Dados')
-        workbook = writer.book
-        worksheet = writer.sheets['Dados']
-        
-        # --- FORMATOS VISUAIS ---
-        # Formato do Cabeçalho (Azul corporativo, texto branco, negrito)
-        formato_cabecalho = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'vcenter',
-            'fg_color': '#002060', 
-            'font_color': 'white',
-            'border': 1
-        })
-        
-        # Formato de Texto (Impede o Excel de comer zeros e usar notação científica)
-        formato_texto = workbook.add_format({'num_format': '@'})
-        
-        # --- APLICANDO FORMATOS E LARGURAS ---
-        for col_num, nome_coluna in enumerate(df.columns.values):
-            # Pinta o cabeçalho
-            worksheet.write(0, col_num, nome_coluna, formato_cabecalho)
-            
-            # Calcula a largura ideal da coluna
-            tamanho_max = max(df[nome_coluna].astype(str).map(len).max(), len(str(nome_coluna))) + 2
-            
-            # Se for coluna sensível, aplica o formato de texto na coluna toda
-            colunas_sensiveis = ['PEDIDO', 'LOTE', 'Número do Pedido']
-            if nome_coluna in colunas_sensiveis:
-                worksheet.set_column(col_num, col_num, tamanho_max, formato_texto)
-            else:
-                worksheet.set_column(col_num, col_num, tamanho_max)
-                
-    return output.getvalue()        
+    # Cria o arquivo Excel usando o xlsxwriter em modo streaming (constant_memory): cada linha vai
+    # para o arquivo assim que é escrita, então a memória não cresce com o tamanho da exportação.
+    # Nesse modo as linhas têm que ser escritas em ordem, por isso a planilha é montada aqui
+    # linha a linha em vez de usar o df.to_excel do pandas (que escreve coluna por coluna).
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy'})
+    worksheet = workbook.add_worksheet('Dados')
+    
+    # --- FORMATOS VISUAIS ---
+    # Formato do Cabeçalho (Azul corporativo, texto branco, negrito)
+    formato_cabecalho = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'vcenter',
+        'fg_color': '#002060', 
+        'font_color': 'white',
+        'border': 1
+    })
+    
+    # Formato de Texto (Impede o Excel de comer zeros e usar notação científica)
+    formato_texto = workbook.add_format({'num_format': '@'})
+    
+    # --- APLICANDO FORMATOS E LARGURAS ---
+    colunas_sensiveis = ['PEDIDO', 'LOTE', 'Número do Pedido']
+    for col_num, nome_coluna in enumerate(df.columns.values):
+        # Calcula a largura ideal da coluna
+        tamanho_max = int(max(df[nome_coluna].astype(str).str.len().max() if len(df) else 0, len(str(nome_coluna)))) + 2
+        
+        # Se for coluna sensível, aplica o formato de texto na coluna toda
+        if nome_coluna in colunas_sensiveis:
+            worksheet.set_column(col_num, col_num, tamanho_max, formato_texto)
+        else:
+            worksheet.set_column(col_num, col_num, tamanho_max)
+    
+    # Pinta o cabeçalho
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], formato_cabecalho)
+    
+    # Dados (vazios viram célula em branco, como no to_excel)
+    valores = df.astype(object).where(df.notna(), None)
+    for num_linha, linha in enumerate(valores.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(num_linha, 0, linha)
+    
+    workbook.close()
+    return output.getvalue()
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def gerar_excel_em_cache(_df, funcao, versao, filtro):
+    """Excel guardado por (conjunto, versão dos dados, filtro da tela). O DataFrame não entra no hash."""
+    return gerar_excel_formatado(_df)
+
+def botao_excel(df, funcao_carregamento, filtro, nome_arquivo, key):
+    """
+    O Excel só é montado quando o usuário pede ("Gerar Excel"); depois disso o botão de download
+    aparece com o arquivo pronto. O arquivo fica em cache por versão dos dados + filtro, então
+    outro clique (ou outro usuário com o mesmo filtro) não gera de novo.
+    """
+    versao = versao_dados(funcao_carregamento)
+    pedido = (versao, filtro)
+    if st.button("📊 Gerar Excel", key=f"{key}_gerar"):
+        st.session_state[f"{key}_pedido"] = pedido
+    if st.session_state.get(f"{key}_pedido") != pedido:
+        return # Filtro ou dados mudaram desde o último pedido: espera um novo clique
+    
+    with st.spinner("Gerando Excel..."):
+        if versao is None: dados = gerar_excel_formatado(df) # Sem versão não dá para reaproveitar
+        else: dados = gerar_excel_em_cache(df, funcao_carregamento.__name__, versao, filtro)
+    st.download_button(
+        label="📥 Baixar Tabela (Excel)",
+        data=dados,
+        file_name=f"{nome_arquivo}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key=key
+    )
 
 def formatar_br_decimal(valor, casas=3):
     try:
@@ -208,23 +1160,103 @@ def formatar_br_decimal(valor, casas=3):
 
 @st.cache_data(ttl="30m", show_spinner=False)
 def carregar_usuarios():
-    # Login precisa ser confiável, então tenta mais vezes
-    df_users = ler_com_retry(URL_SISTEMA, "Usuarios", tentativas=10, espera=2)
-    if df_users is not None and not df_users.empty: return df_users.astype(str)
+    # Login: tenta algumas vezes, mas nunca prende a tela por mais de PRAZO_LEITURA_LOGIN segundos
+    # (se estourar, o login segue com o diretório que já está na memória)
+    df_users = ler_com_retry(URL_SISTEMA, "Usuarios", tentativas=4, espera=1, prazo_maximo=PRAZO_LEITURA_LOGIN)
+    if df_users is None: return None # Erro de conexão: o login continua com o diretório que já está na memória
+    if not df_users.empty: return df_users.astype(str)
     return pd.DataFrame()
 
 
+# --- ESQUEMAS DAS ABAS ---
+# Tipo de cada coluna, aplicado uma vez na carga (colunas que não estão aqui ficam como texto):
+#   "categoria" -> poucos valores repetidos (filial, vendedor, status...): ocupa bem menos memória
+#   "numero"    -> float64 (quantidades e toneladas, que são somadas)
+#   "float32"   -> medidas (espessura, largura, comprimento)
+#   ("data", "COLUNA_ORIGEM") -> datetime lido de outra coluna de texto (dd/mm/aaaa)
+ESQUEMA_FATURAMENTO = {"FILIAL": "categoria", "VENDEDOR": "categoria", "TONS": "numero", "DATA_DT": ("data", "DATA_EMISSAO")}
+ESQUEMAS_ABAS = {
+    "Dados_Faturamento": ESQUEMA_FATURAMENTO,
+    "Dados_Faturamento_Transf": ESQUEMA_FATURAMENTO,
+    "Dados_Fat_Vendedores": ESQUEMA_FATURAMENTO,
+    "Dados_Estoque": {"FILIAL": "categoria", "ARMAZEM": "categoria",
+                      "QTDE": "numero", "EMPENHADO": "numero", "DISPONIVEL": "numero",
+                      "ESPES": "float32", "LARGURA": "float32", "COMPRIMENTO": "float32",
+                      "DATA_ENTRADA": ("data", "DIAS.ESTOQUE")},
+    "Dados_Producao": {"MAQUINA": "categoria", "TURNO": "categoria", "VOLUME": "numero", "DATA_DT": ("data", "DATA")},
+    # Valores em R$ continuam texto: a tela mostra o texto da planilha quando ele não é número
+    "Dados_Credito": {"VENDEDOR": "categoria", "GERENTE": "categoria", "RISCO_DE_BLOQUEIO": "categoria",
+                      "RECEBIVEIS": "categoria", "VENCIMENTO LC": "categoria", "OPCAO_DE_FATURAMENTO": "categoria",
+                      "SITUACAO LC": "categoria"},
+    "Dados_Carteira": {"FILIAL": "categoria", "VENDEDOR": "categoria", "GERENTE": "categoria", "STATUS": "categoria",
+                       "TONS": "numero"},
+    "Dados_Titulos": {"STATUS_RESUMO": "categoria", "TIPO_DE_FATURAMENTO": "categoria"},
+    # Tabela consolidada das abas de máquina (Pinheiral + Bicas)
+    "Pedidos": {"Filial_Origem": "categoria", "Máquina/Processo": "categoria", "Vendedor Correto": "categoria",
+                "Gerente Correto": "categoria", "Quantidade": "numero"},
+}
+
+def aplicar_esquema(df, esquema):
+    """Converte as colunas do DataFrame para os tipos declarados no esquema (ignora as que não existem)."""
+    for coluna, tipo in esquema.items():
+        origem = coluna
+        if isinstance(tipo, tuple): tipo, origem = tipo
+        if origem not in df.columns: continue
+        if tipo == "categoria":
+            df[coluna] = df[origem].astype("category")
+        elif tipo == "numero":
+            df[coluna] = converter_coluna_numerica(df[origem])
+        elif tipo == "float32":
+            df[coluna] = converter_coluna_numerica(df[origem]).astype("float32")
+        elif tipo == "data":
+            df[coluna] = pd.to_datetime(df[origem], dayfirst=True, errors='coerce')
+    return df
+
+# --- ETAPAS DE TRATAMENTO ---
+# Funções puras (DataFrame cru da planilha -> DataFrame pronto), sem Google e sem cache.
+# Os carregar_* só leem e chamam estas etapas; o benchmark_painel.py mede cada uma isolada.
+
+def tratar_dados_nuvem(df, aba="Dados_Faturamento"):
+    """Faturamento (direto, transferência e por vendedor): TONS numérico e DATA_DT."""
+    df.columns = df.columns.str.strip().str.upper()
+    return aplicar_esquema(df, ESQUEMAS_ABAS.get(aba, ESQUEMA_FATURAMENTO))
+
+def tratar_estoque(df, agora=None):
+    """Estoque: dias parado (a partir de DIAS.ESTOQUE), medidas/quantidades numéricas e espessura em mm."""
+    df.columns = df.columns.str.strip().str.upper()
+    df = aplicar_esquema(df, ESQUEMAS_ABAS["Dados_Estoque"])
+    if 'DATA_ENTRADA' in df.columns:
+        try:
+            agora = agora or datetime.now()
+            df['DIAS'] = (agora - df['DATA_ENTRADA']).dt.days
+            df['DIAS'] = df['DIAS'].fillna(0).astype(int)
+        except:
+            df['DIAS'] = 0
+    else:
+        df['DIAS'] = 0
+    if 'ESPES' in df.columns:
+        df['ESPES'] = df['ESPES'] / 100.0
+    return df
+
+def tratar_manutencao(df):
+    """Manutenção: renomeia as colunas que vêm do Google Forms para nomes fixos."""
+    # O Forms geralmente cria "Carimbo de data/hora", "Qual a máquina?", etc.
+    # Vamos normalizar para não dar erro no código.
+    cols_atuais = df.columns.tolist()
+    mapa_colunas = {
+        cols_atuais[0]: "Data_Abertura", # A 1ª coluna é sempre o timestamp
+        cols_atuais[1]: "Maquina",
+        cols_atuais[2]: "Operador",
+        cols_atuais[3]: "Tipo_Problema",
+        cols_atuais[4]: "Descricao"
+    }
+    return df.rename(columns=mapa_colunas)
+
 @st.cache_data(ttl="10m", show_spinner=False)
 def ler_dados_nuvem_generico(aba, url_planilha):
     df = ler_com_retry(url_planilha, aba)
     if df is None: return None # Retorna None para ativar persistência
-    if not df.empty:
-        df.columns = df.columns.str.strip().str.upper()
-        if 'TONS' in df.columns:
-            df['TONS'] = df['TONS'].apply(converte_numero_seguro)
-        if 'DATA_EMISSAO' in df.columns:
-            df['DATA_DT'] = pd.to_datetime(df['DATA_EMISSAO'], dayfirst=True, errors='coerce')
-        return df
+    if not df.empty: return tratar_dados_nuvem(df, aba)
     return pd.DataFrame()
 
 def carregar_dados_faturamento_direto(): return ler_dados_nuvem_generico("Dados_Faturamento", URL_SISTEMA)
@@ -234,48 +1266,24 @@ def carregar_dados_faturamento_transf(): return ler_dados_nuvem_generico("Dados_
 def carregar_faturamento_vendedores():
     df = ler_com_retry(URL_SISTEMA, "Dados_Fat_Vendedores")
     if df is None: return None
-    if not df.empty:
-        df.columns = df.columns.str.strip().str.upper()
-        if 'TONS' in df.columns:
-            df['TONS'] = df['TONS'].apply(converte_numero_seguro)
-        if 'DATA_EMISSAO' in df.columns:
-            df['DATA_DT'] = pd.to_datetime(df['DATA_EMISSAO'], dayfirst=True, errors='coerce')
-        return df
+    if not df.empty: return tratar_dados_nuvem(df, "Dados_Fat_Vendedores")
     return pd.DataFrame()
 
 @st.cache_data(ttl="10m", show_spinner=False)
 def carregar_estoque():
     df = ler_com_retry(URL_SISTEMA, "Dados_Estoque")
     if df is None: return None # Erro de conexão = None
-    if not df.empty:
-        df.columns = df.columns.str.strip().str.upper()
-        if 'DIAS.ESTOQUE' in df.columns:
-            try:
-                df['DATA_ENTRADA'] = pd.to_datetime(df['DIAS.ESTOQUE'], dayfirst=True, errors='coerce')
-                agora = datetime.now()
-                df['DIAS'] = (agora - df['DATA_ENTRADA']).dt.days
-                df['DIAS'] = df['DIAS'].fillna(0).astype(int)
-            except:
-                df['DIAS'] = 0
-        else:
-            df['DIAS'] = 0
-        cols_float = ['QTDE', 'EMPENHADO', 'DISPONIVEL', 'ESPES', 'LARGURA', 'COMPRIMENTO']
-        for col in cols_float:
-            if col in df.columns:
-                df[col] = df[col].apply(converte_numero_seguro)
-        if 'ESPES' in df.columns:
-            df['ESPES'] = df['ESPES'] / 100.0
-        return df
+    if not df.empty: return tratar_estoque(df)
     return pd.DataFrame()
 
 @st.cache_data(ttl="10m", show_spinner=False)
 def carregar_metas_faturamento():
     df = ler_com_retry(URL_SISTEMA, "Metas_Faturamento")
-    if df is None: return pd.DataFrame(columns=['FILIAL', 'META']) # Metas podem falhar sem quebrar
+    if df is None: return None # Erro de conexão = None (as telas já tratam metas vazias)
     if df.empty: return pd.DataFrame(columns=['FILIAL', 'META'])
     df.columns = df.columns.str.strip().str.upper()
     if 'META' in df.columns:
-        df['META'] = df['META'].apply(converte_numero_seguro)
+        df['META'] = converter_coluna_numerica(df['META'])
     return df
 
 @st.cache_data(ttl="10m", show_spinner=False)
@@ -284,20 +1292,17 @@ def carregar_dados_producao_nuvem():
     if df is None: return None
     if not df.empty:
         df.columns = df.columns.str.strip().str.upper()
-        if 'VOLUME' in df.columns:
-            df['VOLUME'] = df['VOLUME'].apply(converte_numero_seguro)
-        if 'DATA' in df.columns:
-            df['DATA_DT'] = pd.to_datetime(df['DATA'], dayfirst=True, errors='coerce')
-        return df
+        return aplicar_esquema(df, ESQUEMAS_ABAS["Dados_Producao"])
     return pd.DataFrame()
 
 @st.cache_data(ttl="10m", show_spinner=False)
 def carregar_metas_producao():
     df = ler_com_retry(URL_SISTEMA, "Metas_Producao")
-    if df is None or df.empty: return pd.DataFrame(columns=['MAQUINA', 'META'])
+    if df is None: return None # Erro de conexão = None
+    if df.empty: return pd.DataFrame(columns=['MAQUINA', 'META'])
     df.columns = df.columns.str.strip().str.upper()
     if 'META' in df.columns:
-        df['META'] = df['META'].apply(converte_numero_seguro)
+        df['META'] = converter_coluna_numerica(df['META'])
     return df
 
 @st.cache_data(ttl="5m", show_spinner=False)
@@ -359,6 +1364,10 @@ def carregar_feedbacks_avisos():
     if df is None: return pd.DataFrame()
     return df
 
+def limpar_avisos():
+    """Depois que a ciência foi gravada: a próxima tela relê os avisos."""
+    recarregar_dados(carregar_feedbacks_avisos)
+
 def registrar_ciencia_aviso(login, nome, tipo_aviso="Status_Servidor"):
     try:
         agora_br = datetime.now(FUSO_BR).strftime("%d/%m/%Y %H:%M:%S")
@@ -376,10 +1385,8 @@ def registrar_ciencia_aviso(login, nome, tipo_aviso="Status_Servidor"):
             "Mensagem": "Ciente"
         }])
         
-        if escrever_no_sheets(URL_SISTEMA, "Feedback_Vendedores", nova_linha, modo="append"):
-            carregar_feedbacks_avisos.clear()
-            return True
-        return False
+        # Função fixa (não lambda) para a fila reconhecer que o lote já tem esse callback
+        return enfileirar_no_sheets(URL_SISTEMA, "Feedback_Vendedores", nova_linha, ao_gravar=limpar_avisos)
     except:
         return False
 
@@ -389,91 +1396,98 @@ def carregar_status_robo():
     if df is None: return None
     return df
 
-@st.cache_data(ttl="15m", show_spinner=False)
-def carregar_dados_pedidos():
-    dados_consolidados = []
+# --- LISTA DE EMOJIS PARA REMOÇÃO FORÇADA ---
+# (os números com moldura levam o dígito junto; o resto já cairia no filtro de símbolos)
+EMOJIS_PCP = ['0️⃣', '1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟', 
+              '🔥', '⭐', '🔴', '🟡', '🟢', '🔵', '⏳', '🟫', '🟨', '⬜️', '🔗', '⚖️', '📡', '❌', '⏸️', '🔄', '☑️']
+
+# Uma única passada: tenta primeiro os emojis compostos (maiores antes) e, se não for nenhum,
+# remove qualquer símbolo fora de letras, números, espaço e . , - / ( )
+REGEX_LIMPEZA_PCP = re.compile("|".join(re.escape(e) for e in sorted(EMOJIS_PCP, key=len, reverse=True))
+                               + r'|[^\w\s\.,\-\/\(\)]')
+
+def limpar_texto_pcp(serie):
+    """Lava-jato do PCP: tira emojis e símbolos estranhos de uma coluna de texto e apara os espaços."""
+    return serie.str.replace(REGEX_LIMPEZA_PCP, '', regex=True).str.strip()
+
+def tratar_aba_pedidos(df, aba, filial_origem, traduzir_pcp=False):
+    """
+    Limpeza de UMA aba de máquina do PCP.
+    Retorna o DataFrame padronizado ou None se a aba não tiver o formato esperado.
+    """
+    df = df.astype(str)
+
+    if traduzir_pcp:
+        # --- TRADUTOR DO PCP ONLINE ---
+        df = df.rename(columns={
+            "PEDIDO": "Número do Pedido",
+            "CLIENTE CORRETO": "Cliente Correto",
+            "PRODUTO": "Produto",
+            "QTDE": "Quantidade",
+            "PREVISÃO": "Prazo",
+            "VEND. CORRETO": "Vendedor Correto",
+            "GER. CORRETO": "Gerente Correto"
+        })
+        
+        # --- NOVO: FILTRO DE ITENS AGUARDANDO ---
+        if 'Prazo' in df.columns:
+            df = df[df['Prazo'].astype(str).str.strip() != ""]
+            df = df[~df['Prazo'].astype(str).str.lower().isin(['nan', 'none', 'nat', 'null'])]
+        # ----------------------------------------
+
+    df['Máquina/Processo'] = aba
+    df['Filial_Origem'] = filial_origem
+    cols_necessarias = ["Número do Pedido", "Cliente Correto", "Produto", "Quantidade", "Prazo", "Vendedor Correto", "Gerente Correto"]
+    cols_existentes = [c for c in cols_necessarias if c in df.columns]
     
-    # --- LISTA DE EMOJIS PARA REMOÇÃO FORÇADA ---
-    emojis_compostos = ['0️⃣', '1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟', 
-                        '🔥', '⭐', '🔴', '🟡', '🟢', '🔵', '⏳', '🟫', '🟨', '⬜️', '🔗', '⚖️', '📡', '❌', '⏸️', '🔄', '☑️']
+    if "Vendedor Correto" not in cols_existentes:
+        return None
 
-    # Pinheiral
-    for aba in ABAS_PINHEIRAL:
-        df = ler_com_retry(URL_PINHEIRAL, aba, tentativas=2)
-        if df is not None and not df.empty:
-            df = df.astype(str)
-            
-            # --- TRADUTOR DO PCP ONLINE ---
-            df = df.rename(columns={
-                "PEDIDO": "Número do Pedido",
-                "CLIENTE CORRETO": "Cliente Correto",
-                "PRODUTO": "Produto",
-                "QTDE": "Quantidade",
-                "PREVISÃO": "Prazo",
-                "VEND. CORRETO": "Vendedor Correto",
-                "GER. CORRETO": "Gerente Correto"
-            })
-            
-            # --- NOVO: FILTRO DE ITENS AGUARDANDO ---
-            if 'Prazo' in df.columns:
-                df = df[df['Prazo'].astype(str).str.strip() != ""]
-                df = df[~df['Prazo'].astype(str).str.lower().isin(['nan', 'none', 'nat', 'null'])]
-            # ----------------------------------------
-            
-            df['Máquina/Processo'] = aba
-            df['Filial_Origem'] = "PINHEIRAL"
-            cols_necessarias = ["Número do Pedido", "Cliente Correto", "Produto", "Quantidade", "Prazo", "Vendedor Correto", "Gerente Correto"]
-            cols_existentes = [c for c in cols_necessarias if c in df.columns]
-            
-            if "Vendedor Correto" in cols_existentes:
-                df_limpo = df[cols_existentes + ['Máquina/Processo', 'Filial_Origem']].copy()
-                
-                # --- NOVO: LAVA-JATO (REMOVEDOR DE EMOJIS) ---
-                colunas_sujas = ["Número do Pedido", "Cliente Correto", "Produto"]
-                for col in colunas_sujas:
-                    if col in df_limpo.columns:
-                        for e in emojis_compostos:
-                            df_limpo[col] = df_limpo[col].str.replace(e, '', regex=False)
-                        # Remove qualquer outro símbolo estranho e espaços duplos
-                        df_limpo[col] = df_limpo[col].str.replace(r'[^\w\s\.,\-\/\(\)]', '', regex=True).str.strip()
-                # ---------------------------------------------
-                
-                if "Número do Pedido" in df_limpo.columns:
-                    df_limpo["Número do Pedido"] = df_limpo["Número do Pedido"].str.replace(r'\.0$', '', regex=True).str.strip().str.zfill(6)
-                dados_consolidados.append(df_limpo)
-        time.sleep(0.5)
+    df_limpo = df[cols_existentes + ['Máquina/Processo', 'Filial_Origem']].copy()
+    
+    # --- NOVO: LAVA-JATO (REMOVEDOR DE EMOJIS) ---
+    colunas_sujas = ["Número do Pedido", "Cliente Correto", "Produto"]
+    for col in colunas_sujas:
+        if col in df_limpo.columns:
+            df_limpo[col] = limpar_texto_pcp(df_limpo[col])
+    # ---------------------------------------------
+    
+    if "Número do Pedido" in df_limpo.columns:
+        df_limpo["Número do Pedido"] = df_limpo["Número do Pedido"].str.replace(r'\.0$', '', regex=True).str.strip().str.zfill(6)
+    return df_limpo
 
-    # Bicas
-    for aba in ABAS_BICAS:
-        df = ler_com_retry(URL_BICAS, aba, tentativas=2)
+def consolidar_pedidos(abas_lidas):
+    """
+    Recebe [(df, aba, filial_origem, traduzir_pcp)], limpa cada aba e junta tudo numa tabela só.
+    Se nenhuma aba foi lida (todas None = erro de conexão), retorna None como os outros carregadores.
+    """
+    if all(df is None for df, _, _, _ in abas_lidas): return None
+    dados_consolidados = []
+    for df, aba, filial_origem, traduzir_pcp in abas_lidas:
         if df is not None and not df.empty:
-            df = df.astype(str)
-            df['Máquina/Processo'] = aba
-            df['Filial_Origem'] = "SJ BICAS"
-            cols_necessarias = ["Número do Pedido", "Cliente Correto", "Produto", "Quantidade", "Prazo", "Vendedor Correto", "Gerente Correto"]
-            cols_existentes = [c for c in cols_necessarias if c in df.columns]
-            
-            if "Vendedor Correto" in cols_existentes:
-                df_limpo = df[cols_existentes + ['Máquina/Processo', 'Filial_Origem']].copy()
-                
-                # --- NOVO: LAVA-JATO (REMOVEDOR DE EMOJIS) ---
-                colunas_sujas = ["Número do Pedido", "Cliente Correto", "Produto"]
-                for col in colunas_sujas:
-                    if col in df_limpo.columns:
-                        for e in emojis_compostos:
-                            df_limpo[col] = df_limpo[col].str.replace(e, '', regex=False)
-                        # Remove qualquer outro símbolo estranho e espaços duplos
-                        df_limpo[col] = df_limpo[col].str.replace(r'[^\w\s\.,\-\/\(\)]', '', regex=True).str.strip()
-                # ---------------------------------------------
-                
-                if "Número do Pedido" in df_limpo.columns:
-                    df_limpo["Número do Pedido"] = df_limpo["Número do Pedido"].str.replace(r'\.0$', '', regex=True).str.strip().str.zfill(6)
+            df_limpo = tratar_aba_pedidos(df, aba, filial_origem, traduzir_pcp)
+            if df_limpo is not None:
                 dados_consolidados.append(df_limpo)
-        time.sleep(0.5)
-
-    if dados_consolidados: return pd.concat(dados_consolidados, ignore_index=True)
+    # Categorias só depois de juntar: cada aba teria um conjunto diferente e o concat voltaria para texto
+    if dados_consolidados: return aplicar_esquema(pd.concat(dados_consolidados, ignore_index=True), ESQUEMAS_ABAS["Pedidos"])
     return pd.DataFrame()
 
+@st.cache_data(ttl="15m", show_spinner=False)
+def carregar_dados_pedidos():
+    # Uma única requisição (batchGet) por planilha, em vez de uma por máquina
+    origens = [
+        (URL_PINHEIRAL, ABAS_PINHEIRAL, "PINHEIRAL", True),
+        (URL_BICAS, ABAS_BICAS, "SJ BICAS", False)
+    ]
+    # As duas planilhas são lidas ao mesmo tempo
+    motor = obter_motor_leitura()
+    futuros = [motor["leituras"].submit(ler_abas_em_lote, url, abas, 2) for url, abas, _, _ in origens]
+    abas_lidas = []
+    for (url, abas, filial_origem, traduzir_pcp), futuro in zip(origens, futuros):
+        dfs_abas = futuro.result()
+        abas_lidas += [(dfs_abas.get(aba), aba, filial_origem, traduzir_pcp) for aba in abas]
+    return consolidar_pedidos(abas_lidas)
+
 @st.cache_data(ttl="5m", show_spinner=False)
 def carregar_dados_credito():
     df = ler_com_retry(URL_SISTEMA, "Dados_Credito")
@@ -481,7 +1495,7 @@ def carregar_dados_credito():
     if not df.empty:
         df = df.astype(str)
         df.columns = df.columns.str.strip().str.upper()
-        return df
+        return aplicar_esquema(df, ESQUEMAS_ABAS["Dados_Credito"])
     return pd.DataFrame()
 
 @st.cache_data(ttl="5m", show_spinner=False)
@@ -491,7 +1505,7 @@ def carregar_dados_carteira():
     if not df.empty:
         df = df.astype(str)
         df.columns = df.columns.str.strip().str.upper()
-        return df
+        return aplicar_esquema(df, ESQUEMAS_ABAS["Dados_Carteira"])
     return pd.DataFrame()
 
 @st.cache_data(ttl="5m", show_spinner=False)
@@ -501,7 +1515,7 @@ def carregar_dados_titulos():
     if not df.empty:
         df = df.astype(str)
         df.columns = df.columns.str.strip().str.upper()
-        return df
+        return aplicar_esquema(df, ESQUEMAS_ABAS["Dados_Titulos"])
     return pd.DataFrame()
 
 @st.cache_data(ttl="1m", show_spinner=False)
@@ -509,20 +1523,7 @@ def carregar_dados_manutencao():
     # Tenta ler a aba Dados_Manutencao
     df = ler_com_retry(URL_SISTEMA, "Dados_Manutencao")
     if df is None: return None
-    if not df.empty:
-        # Renomeia as colunas que vêm do Google Forms para facilitar
-        # O Forms geralmente cria "Carimbo de data/hora", "Qual a máquina?", etc.
-        # Vamos normalizar para não dar erro no código.
-        cols_atuais = df.columns.tolist()
-        mapa_colunas = {
-            cols_atuais[0]: "Data_Abertura", # A 1ª coluna é sempre o timestamp
-            cols_atuais[1]: "Maquina",
-            cols_atuais[2]: "Operador",
-            cols_atuais[3]: "Tipo_Problema",
-            cols_atuais[4]: "Descricao"
-        }
-        df = df.rename(columns=mapa_colunas)
-        return df
+    if not df.empty: return tratar_manutencao(df)
     return pd.DataFrame()
 
 # ==============================================================================
@@ -545,7 +1546,7 @@ def registrar_acesso(login, nome):
     try:
         agora_br = datetime.now(FUSO_BR).strftime("%d/%m/%Y %H:%M:%S")
         novo_log = pd.DataFrame([{"Data": agora_br, "Login": login, "Nome": nome}])
-        escrever_no_sheets(URL_SISTEMA, "Acessos", novo_log, modo="append")
+        enfileirar_no_sheets(URL_SISTEMA, "Acessos", novo_log, ao_gravar=carregar_logs_acessos.clear)
     except: pass
 
 def salvar_nova_solicitacao(nome, email, login, senha):
@@ -591,38 +1592,37 @@ def salvar_solicitacao_nota(vendedor_nome, vendedor_email, nf_numero, filial):
         return False
     except: return False
 
-def atualizar_chamado_manutencao(row_index, status, prioridade, mecanico, inicio, fim, solucao):
+def atualizar_chamado_manutencao(row_index, status, prioridade, mecanico, inicio, fim, solucao, data_abertura_esperada=None):
+    """
+    Grava as colunas de gestão (F:K) do chamado. Retorna:
+    - "ok": gravado.
+    - "linha_mudou": a linha não é mais esse chamado (nada foi gravado).
+    - "erro": falha de conexão/gravação.
+    """
     try:
-        client = get_gspread_client_cached()
-        sheet = client.open_by_url(URL_SISTEMA)
-        worksheet = sheet.worksheet("Dados_Manutencao")
+        backend = obter_backend()
+        motor = obter_motor_leitura()
         
         # O índice da linha no Google Sheets é = index do dataframe + 2 
         # (+1 pelo cabeçalho, +1 pq o google começa no 1 e o python no 0)
         linha_sheet = row_index + 2
         
-        # Atualiza as colunas de Gestão (F, G, H, I, J, K...)
-        # Ajuste as letras/números das colunas conforme sua planilha real
-        # Supondo: F=Status, G=Prioridade, H=Mecanico, I=Inicio, J=Fim, K=Solucao
-        
-        # Atualiza Status (Coluna 6 se for a F, ou conte na sua planilha)
-        # DICA: Se "Descricao" é a Coluna 5 (E), então Status é 6 (F), Prioridade 7 (G)...
+        # Confere se a linha ainda é o mesmo chamado (alguém pode ter apagado/ordenado a planilha)
+        if data_abertura_esperada is not None:
+            conferir = lambda: backend.ler_celula(URL_SISTEMA, "Dados_Manutencao", f"A{linha_sheet}")
+            data_na_planilha = executar_com_retentativa(conferir, tentativas=4, limitador=motor["limitador"], so_cota=True)
+            if str(data_na_planilha or "").strip() != str(data_abertura_esperada).strip():
+                return "linha_mudou"
         
-        # Vamos enviar uma lista para atualizar a linha de uma vez nas colunas certas
-        # Ajuste o range conforme onde você escreveu os cabeçalhos na planilha
-        # Exemplo: Atualizando da coluna 6 (Status) até a 11 (Solucao)
+        # Colunas de Gestão, gravadas de uma vez só (tudo ou nada):
+        # F=Status, G=Prioridade, H=Mecanico, I=Inicio, J=Fim, K=Solucao
+        valores = [[status, prioridade, mecanico, inicio, fim, solucao]]
+        gravar = lambda: backend.atualizar_intervalo(URL_SISTEMA, "Dados_Manutencao", f"F{linha_sheet}:K{linha_sheet}", valores)
+        executar_com_retentativa(gravar, tentativas=4, limitador=motor["limitador_escrita"], so_cota=True)
         
-        worksheet.update_cell(linha_sheet, 6, status)      # Coluna F
-        worksheet.update_cell(linha_sheet, 7, prioridade)  # Coluna G
-        worksheet.update_cell(linha_sheet, 8, mecanico)    # Coluna H
-        worksheet.update_cell(linha_sheet, 9, inicio)      # Coluna I
-        worksheet.update_cell(linha_sheet, 10, fim)        # Coluna J
-        worksheet.update_cell(linha_sheet, 11, solucao)    # Coluna K
-        
-        return True
-    except Exception as e:
-        st.error(f"Erro ao salvar: {e}")
-        return False    
+        return "ok"
+    except Exception:
+        return "erro"
 
 def formatar_peso_brasileiro(valor):
     try:
@@ -639,31 +1639,91 @@ def formatar_moeda(valor):
         return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     except: return str(valor)
 
+# --- VERSÕES VETORIZADAS (COLUNA INTEIRA DE UMA VEZ) ---
+# Mesmo texto das funções acima, mas sem chamar uma função Python por célula.
+
+def _numeros_com_casas(numeros, casas):
+    """'1234567.5' -> '1234567,500' (vírgula decimal, ainda sem o ponto de milhar)."""
+    texto = np.char.mod(f"%.{casas}f", numeros.to_numpy(dtype=float))
+    return pd.Series(texto, index=numeros.index, dtype=object).str.replace('.', ',', regex=False)
+
+def _com_milhar(texto, casas):
+    """Coloca o ponto de milhar só na parte inteira: '1234567,500' -> '1.234.567,500'."""
+    padrao = r'(\d)(?=(?:\d{3})+,)' if casas > 0 else r'(\d)(?=(?:\d{3})+$)'
+    return texto.str.replace(padrao, r'\1.', regex=True)
+
+def formatar_br_decimal_coluna(serie, casas=3):
+    """Coluna inteira no formato do formatar_br_decimal. O que não é número continua como texto."""
+    numeros = pd.to_numeric(serie, errors='coerce')
+    texto = _com_milhar(_numeros_com_casas(numeros, casas), casas)
+    return texto.where(numeros.notna() | serie.isna(), serie.astype(str))
+
+def formatar_peso_coluna(serie):
+    """Coluna inteira no formato do formatar_peso_brasileiro (sem zeros à direita; vazio = "0")."""
+    numeros = pd.to_numeric(serie, errors='coerce')
+    texto = _numeros_com_casas(numeros, 3).str.replace(r'0+$', '', regex=True).str.replace(r',$', '', regex=True)
+    vazio = serie.isna() | (serie.astype(str) == "")
+    texto = texto.where(numeros.notna() | vazio, serie.astype(str))
+    return texto.mask(vazio, "0")
+
+def formatar_moeda_coluna(serie):
+    """Coluna inteira no formato do formatar_moeda. Texto em formato brasileiro é convertido antes."""
+    if pd.api.types.is_numeric_dtype(serie):
+        numeros = serie.astype(float)
+        manter_texto = pd.Series(False, index=serie.index)
+    else:
+        texto_original = serie.astype(str)
+        numeros = pd.to_numeric(texto_original.str.strip().str.replace('.', '', regex=False).str.replace(',', '.', regex=False),
+                                errors='coerce')
+        # Texto que não é número (ex.: vazio) aparece do jeito que veio; "nan" vira R$ 0,00
+        manter_texto = numeros.isna() & ~texto_original.str.strip().str.lower().isin(['nan', '+nan', '-nan'])
+    texto = "R$ " + _com_milhar(_numeros_com_casas(numeros, 2), 2)
+    texto = texto.mask(numeros.isna(), "R$ 0,00")
+    return texto.mask(manter_texto, serie.astype(str))
+
 # ==============================================================================
 # UI
 # ==============================================================================
 
-def plotar_grafico_faturamento(df_filtrado, titulo_grafico, meta_valor=None):
-    if df_filtrado.empty:
+def agregar_faturamento_por_dia(df, data_limite):
+    """
+    Uma linha por dia a partir de data_limite: TONS (soma do dia) e TONS_POSITIVO (soma só das notas
+    com TONS > 0, usada no "Último Faturamento"), já com os textos do gráfico. Um groupby só.
+    """
+    df = df[df['DATA_DT'].dt.date >= data_limite.date()]
+    if df.empty:
+        return pd.DataFrame(columns=['DATA_DT', 'TONS', 'TONS_POSITIVO', 'DATA_STR', 'TONS_TXT'])
+    df_dia = (df.assign(DATA_DT=df['DATA_DT'].dt.normalize(), TONS_POSITIVO=df['TONS'].where(df['TONS'] > 0, 0))
+                .groupby('DATA_DT', sort=True)[['TONS', 'TONS_POSITIVO']].sum()
+                .reset_index())
+    df_dia['DATA_STR'] = df_dia['DATA_DT'].dt.strftime('%d/%m/%Y')
+    df_dia['TONS_TXT'] = _numeros_com_casas(df_dia['TONS'], 1)
+    return df_dia
+
+def faturamento_diario(funcao_carregamento, df, periodo, data_limite):
+    """Agregado diário guardado por versão dos dados + período (refeito quando o dia vira, porque o período anda com ele)."""
+    hoje = datetime.now(FUSO_BR).date()
+    return obter_derivado(funcao_carregamento, ("faturamento_diario", periodo),
+                          lambda: agregar_faturamento_por_dia(df, data_limite), dependencias=hoje)
+
+def plotar_grafico_faturamento(df_dia, titulo_grafico, meta_valor=None):
+    if df_dia.empty:
         st.warning(f"Sem dados para {titulo_grafico} neste período.")
         return
     def fmt_br(val): return f"{val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     hoje_normalizado = datetime.now(FUSO_BR).replace(hour=0, minute=0, second=0, microsecond=0)
-    df_hoje = df_filtrado[df_filtrado['DATA_DT'].dt.date == hoje_normalizado.date()]
-    val_hoje = df_hoje['TONS'].sum()
+    datas = df_dia['DATA_DT'].dt.date
+    val_hoje = df_dia.loc[datas == hoje_normalizado.date(), 'TONS'].sum()
     txt_hoje = f"**Hoje ({hoje_normalizado.strftime('%d/%m')}):** {fmt_br(val_hoje)} Ton"
-    df_last = df_filtrado[(df_filtrado['TONS'] > 0) & (df_filtrado['DATA_DT'].dt.date < hoje_normalizado.date())].sort_values('DATA_DT', ascending=False)
+    df_last = df_dia[(df_dia['TONS_POSITIVO'] > 0) & (datas < hoje_normalizado.date())]
     if not df_last.empty:
-        last_date = df_last['DATA_DT'].max()
-        last_val = df_last[df_last['DATA_DT'] == last_date]['TONS'].sum()
-        txt_last = f"**Último Faturamento ({last_date.strftime('%d/%m')}):** {fmt_br(last_val)} Ton"
+        ultimo = df_last.iloc[-1] # df_dia já vem em ordem de data
+        txt_last = f"**Último Faturamento ({ultimo['DATA_DT'].strftime('%d/%m')}):** {fmt_br(ultimo['TONS_POSITIVO'])} Ton"
     else: txt_last = "**Último Faturamento:** -"
     st.markdown(f"### {titulo_grafico}")
     st.markdown(f"{txt_hoje} | {txt_last}")
-    df_chart = df_filtrado.copy()
-    df_chart['DATA_STR'] = df_chart['DATA_DT'].dt.strftime('%d/%m/%Y')
-    df_chart['TONS_TXT'] = df_chart['TONS'].apply(lambda x: f"{x:.1f}".replace('.', ','))
-    base = alt.Chart(df_chart).encode(x=alt.X('DATA_STR', title=None, sort=None, axis=alt.Axis(labelAngle=0)))
+    # Só as colunas do gráfico vão para o navegador (uma linha por dia)
+    base = alt.Chart(df_dia[['DATA_STR', 'TONS', 'TONS_TXT']]).encode(x=alt.X('DATA_STR', title=None, sort=None, axis=alt.Axis(labelAngle=0)))
     barras = base.mark_bar(color='#0078D4', size=40).encode(y=alt.Y('TONS', title='Toneladas'), tooltip=['DATA_STR', 'TONS'])
     rotulos = base.mark_text(dy=-10, color='black').encode(y=alt.Y('TONS'), text=alt.Text('TONS_TXT'))
     grafico = (barras + rotulos)
@@ -679,8 +1739,7 @@ def exibir_aba_faturamento():
     st.subheader("📊 Painel de Faturamento")
     if st.button("🔄 Atualizar Gráfico"):
         with st.spinner("Buscando dados sincronizados..."):
-            carregar_dados_faturamento_direto.clear()
-            carregar_dados_faturamento_transf.clear()
+            recarregar_dados(ler_dados_nuvem_generico, carregar_dados_faturamento_direto, carregar_dados_faturamento_transf)
             st.rerun() # Persistencia ativa
             
     # USO DA FUNÇÃO BLINDADA
@@ -700,7 +1759,7 @@ def exibir_aba_faturamento():
             if st.form_submit_button("💾 Salvar Metas"):
                 if salvar_metas_faturamento(novas_metas):
                     st.success("Meta atualizada!")
-                    carregar_metas_faturamento.clear()
+                    recarregar_dados(carregar_metas_faturamento)
                     st.rerun()
     st.divider()
     periodo = st.radio("Selecione o Período:", ["Últimos 7 Dias", "Acumulado Mês Corrente"], horizontal=True, key="fat_periodo")
@@ -709,24 +1768,80 @@ def exibir_aba_faturamento():
     else: data_limite = hoje_normalizado.replace(day=1)
     
     if not df_direto.empty:
-        df_filtro_direto = df_direto[df_direto['DATA_DT'].dt.date >= data_limite.date()]
+        df_dia_direto = faturamento_diario(carregar_dados_faturamento_direto, df_direto, periodo, data_limite)
         meta_direto = 0
         if not df_meta.empty:
             fmeta = df_meta[df_meta['FILIAL'] == 'PINHEIRAL']
             if not fmeta.empty: meta_direto = float(fmeta.iloc[0]['META'])
-        plotar_grafico_faturamento(df_filtro_direto, "Faturamento Direto: Pinheiral", meta_direto)
+        plotar_grafico_faturamento(df_dia_direto, "Faturamento Direto: Pinheiral", meta_direto)
     else: st.info("Sem dados de Faturamento Direto carregados.")
     
     if not df_transf.empty:
-        df_filtro_transf = df_transf[df_transf['DATA_DT'].dt.date >= data_limite.date()]
-        plotar_grafico_faturamento(df_filtro_transf, "Faturamento Transferência: Pinheiral", meta_valor=None) 
+        df_dia_transf = faturamento_diario(carregar_dados_faturamento_transf, df_transf, periodo, data_limite)
+        plotar_grafico_faturamento(df_dia_transf, "Faturamento Transferência: Pinheiral", meta_valor=None) 
     else: st.info("Sem dados de Transferência carregados.")
 
+def grafico_producao_maquina(df_mq, meta_valor):
+    """Barras por dia e turno de uma máquina, com rótulos e a linha da meta."""
+    base = alt.Chart(df_mq).encode(x=alt.X('DATA', title=None, sort=None, axis=alt.Axis(labelAngle=0)))
+    barras = base.mark_bar().encode(xOffset='TURNO', y=alt.Y('VOLUME', title='Tons'), color=alt.Color('TURNO', legend=alt.Legend(title="Turno", orient='top')), tooltip=['DATA', 'TURNO', 'VOLUME'])
+    rotulos = base.mark_text(dy=-10, color='black').encode(xOffset='TURNO', y=alt.Y('VOLUME'), text=alt.Text('VOLUME_TXT'))
+    regra_meta = alt.Chart(pd.DataFrame({'y': [meta_valor]})).mark_rule(color='red', strokeDash=[5, 5]).encode(y='y', size=alt.value(2))
+    texto_meta = alt.Chart(pd.DataFrame({'y': [meta_valor]})).mark_text(align='left', baseline='bottom', color='red', dx=5).encode(y='y', text=alt.value(f"Meta: {meta_valor}"))
+    return (barras + rotulos + regra_meta + texto_meta).properties(height=350)
+
+def resumir_producao(df, df_metas, data_limite, hoje_normalizado):
+    """
+    Tudo que a aba de produção mostra, calculado de uma vez: totais do período e, por máquina, os
+    textos de hoje / última produção (Turno A e C) e o gráfico com a meta. Um groupby por
+    (máquina, dia, turno) alimenta tudo; as máquinas só recortam esse resultado (poucas linhas).
+    Devolve None se não houver produção no período.
+    """
+    df = df[df['DATA_DT'].dt.date >= data_limite.date()]
+    if df.empty: return None
+    def fmt_br(val): return f"{val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    
+    dias_unicos = df['DATA_DT'].nunique()
+    total_prod = df['VOLUME'].sum()
+    resumo = {"total": total_prod, "media_diaria": total_prod / dias_unicos if dias_unicos > 0 else 0, "maquinas": []}
+    
+    # VOLUME_POSITIVO: só os lançamentos > 0, que são os que contam para a "Última Produção"
+    por_dia = (df.assign(DIA=df['DATA_DT'].dt.normalize(), VOLUME_POSITIVO=df['VOLUME'].where(df['VOLUME'] > 0, 0))
+                 .groupby(['MAQUINA', 'DIA', 'TURNO'], observed=True, sort=True)[['VOLUME', 'VOLUME_POSITIVO']].sum()
+                 .reset_index())
+    por_dia['DATA'] = por_dia['DIA'].dt.strftime('%d/%m/%Y')
+    por_dia['VOLUME_TXT'] = _numeros_com_casas(por_dia['VOLUME'], 1)
+    
+    metas = {}
+    if not df_metas.empty:
+        metas = df_metas.drop_duplicates('MAQUINA').set_index('MAQUINA')['META'].astype(float).to_dict()
+    
+    hoje = hoje_normalizado.date()
+    for mq, df_mq in por_dia.groupby('MAQUINA', observed=True, sort=True):
+        datas = df_mq['DIA'].dt.date
+        df_hoje = df_mq[datas == hoje]
+        hoje_a = df_hoje.loc[df_hoje['TURNO'] == 'Turno A', 'VOLUME'].sum()
+        hoje_c = df_hoje.loc[df_hoje['TURNO'] == 'Turno C', 'VOLUME'].sum()
+        texto_hoje = f"**Hoje ({hoje_normalizado.strftime('%d/%m')}):** Turno A: {fmt_br(hoje_a)} | Turno C: {fmt_br(hoje_c)} | **Total: {fmt_br(hoje_a + hoje_c)}**"
+        
+        df_hist = df_mq[(df_mq['VOLUME_POSITIVO'] > 0) & (datas < hoje)]
+        if not df_hist.empty:
+            last_date = df_hist['DIA'].max()
+            df_last = df_hist[df_hist['DIA'] == last_date]
+            last_a = df_last.loc[df_last['TURNO'] == 'Turno A', 'VOLUME_POSITIVO'].sum()
+            last_c = df_last.loc[df_last['TURNO'] == 'Turno C', 'VOLUME_POSITIVO'].sum()
+            texto_last = f"**Última Produção ({last_date.strftime('%d/%m')}):** Turno A: {fmt_br(last_a)} | Turno C: {fmt_br(last_c)} | **Total: {fmt_br(last_a + last_c)}**"
+        else: texto_last = "**Última Produção:** -"
+        
+        grafico = grafico_producao_maquina(df_mq[['DATA', 'TURNO', 'VOLUME', 'VOLUME_TXT']], metas.get(mq, 0))
+        resumo["maquinas"].append((mq, texto_hoje, texto_last, grafico))
+    return resumo
+
 def exibir_aba_producao():
     st.subheader("🏭 Painel de Produção (Pinheiral)")
     if st.button("🔄 Atualizar Produção"):
         with st.spinner("Carregando indicadores..."):
-            carregar_dados_producao_nuvem.clear() 
+            recarregar_dados(carregar_dados_producao_nuvem)
             st.rerun()
             
     # USO DA FUNÇÃO BLINDADA
@@ -750,7 +1865,7 @@ def exibir_aba_producao():
             if st.form_submit_button("💾 Salvar Metas"):
                 if salvar_metas_producao(novas_metas): 
                     st.success("Metas atualizadas!")
-                    carregar_metas_producao.clear()
+                    recarregar_dados(carregar_metas_producao)
                     st.rerun()
     st.divider()
     if not df.empty:
@@ -758,48 +1873,20 @@ def exibir_aba_producao():
         hoje_normalizado = datetime.now(FUSO_BR).replace(hour=0, minute=0, second=0, microsecond=0)
         if periodo == "Últimos 7 Dias": data_limite = hoje_normalizado - timedelta(days=6) 
         else: data_limite = hoje_normalizado.replace(day=1)
-        df_filtro = df[df['DATA_DT'].dt.date >= data_limite.date()]
-        if df_filtro.empty: 
+        versao_metas = versao_dados(carregar_metas_producao)
+        resumo = obter_derivado(carregar_dados_producao_nuvem, ("painel_producao", periodo),
+                                lambda: resumir_producao(df, df_metas, data_limite, hoje_normalizado),
+                                dependencias=(hoje_normalizado.date(), versao_metas))
+        if resumo is None: 
             st.warning("Nenhum dado encontrado para este período.")
             return
-        total_prod = df_filtro['VOLUME'].sum()
-        dias_unicos = df_filtro['DATA_DT'].nunique()
-        media_diaria = total_prod / dias_unicos if dias_unicos > 0 else 0
         k1, k2 = st.columns(2)
-        k1.metric("Total Produzido", f"{total_prod:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " Ton")
-        k2.metric("Média Diária", f"{media_diaria:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " Ton")
+        k1.metric("Total Produzido", f"{resumo['total']:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " Ton")
+        k2.metric("Média Diária", f"{resumo['media_diaria']:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " Ton")
         st.divider()
-        maquinas = sorted(df_filtro['MAQUINA'].unique())
-        def fmt_br(val): return f"{val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        for mq in maquinas:
-            df_mq = df_filtro[df_filtro['MAQUINA'] == mq].copy()
+        for mq, texto_hoje, texto_last, grafico_final in resumo['maquinas']:
             st.markdown(f"### Produção: {mq}")
-            df_hoje = df_mq[df_mq['DATA_DT'].dt.date == hoje_normalizado.date()]
-            hoje_a = df_hoje[df_hoje['TURNO'] == 'Turno A']['VOLUME'].sum()
-            hoje_c = df_hoje[df_hoje['TURNO'] == 'Turno C']['VOLUME'].sum()
-            hoje_total = hoje_a + hoje_c
-            texto_hoje = f"**Hoje ({hoje_normalizado.strftime('%d/%m')}):** Turno A: {fmt_br(hoje_a)} | Turno C: {fmt_br(hoje_c)} | **Total: {fmt_br(hoje_total)}**"
-            df_hist = df_mq[(df_mq['VOLUME'] > 0) & (df_mq['DATA_DT'].dt.date < hoje_normalizado.date())]
-            if not df_hist.empty:
-                last_date = df_hist['DATA_DT'].max()
-                df_last = df_hist[df_hist['DATA_DT'] == last_date]
-                last_a = df_last[df_last['TURNO'] == 'Turno A']['VOLUME'].sum()
-                last_c = df_last[df_last['TURNO'] == 'Turno C']['VOLUME'].sum()
-                last_total = last_a + last_c
-                texto_last = f"**Última Produção ({last_date.strftime('%d/%m')}):** Turno A: {fmt_br(last_a)} | Turno C: {fmt_br(last_c)} | **Total: {fmt_br(last_total)}**"
-            else: texto_last = "**Última Produção:** -"
             st.markdown(texto_hoje); st.markdown(texto_last)
-            df_mq['VOLUME_TXT'] = df_mq['VOLUME'].apply(lambda x: f"{x:.1f}".replace('.', ','))
-            meta_valor = 0
-            if not df_metas.empty:
-                filtro_meta = df_metas[df_metas['MAQUINA'] == mq]
-                if not filtro_meta.empty: meta_valor = float(filtro_meta.iloc[0]['META'])
-            base = alt.Chart(df_mq).encode(x=alt.X('DATA', title=None, axis=alt.Axis(labelAngle=0)))
-            barras = base.mark_bar().encode(xOffset='TURNO', y=alt.Y('VOLUME', title='Tons'), color=alt.Color('TURNO', legend=alt.Legend(title="Turno", orient='top')), tooltip=['DATA', 'TURNO', 'VOLUME'])
-            rotulos = base.mark_text(dy=-10, color='black').encode(xOffset='TURNO', y=alt.Y('VOLUME'), text=alt.Text('VOLUME_TXT'))
-            regra_meta = alt.Chart(pd.DataFrame({'y': [meta_valor]})).mark_rule(color='red', strokeDash=[5, 5]).encode(y='y', size=alt.value(2))
-            texto_meta = alt.Chart(pd.DataFrame({'y': [meta_valor]})).mark_text(align='left', baseline='bottom', color='red', dx=5).encode(y='y', text=alt.value(f"Meta: {meta_valor}"))
-            grafico_final = (barras + rotulos + regra_meta + texto_meta).properties(height=350)
             st.altair_chart(grafico_final, use_container_width=True)
             st.markdown("---")
     elif 'dados_producao' in st.session_state and st.session_state['dados_producao'].empty:
@@ -807,13 +1894,14 @@ def exibir_aba_producao():
     else: st.info("Clique no botão para carregar.")
 
 # --- NOVA ABA DE ESTOQUE (AG-GRID + FILTROS SIMPLIFICADOS) ---
+@st.fragment # Filtros e busca do estoque só redesenham esta seção
 def exibir_aba_estoque():
     st.subheader("📦 Consulta de Estoque Disponível")
     
     col_btn, _ = st.columns([1, 4])
     with col_btn:
         if st.button("🔄 Atualizar Estoque"):
-            carregar_estoque.clear()
+            recarregar_dados(carregar_estoque)
             st.rerun()
     
     # USO DA FUNÇÃO BLINDADA (PERSISTÊNCIA)
@@ -828,13 +1916,13 @@ def exibir_aba_estoque():
     
     c1, c2 = st.columns(2)
     with c1:
-        filial_sel = st.selectbox("Filtrar por Filial:", lista_filiais)
+        filial_sel = st.selectbox("Filtrar por Filial:", lista_filiais, key="filial_estoque")
     with c2:
-        busca = st.text_input("Buscar (aperte enter após digitar):")
+        busca = st.text_input("Buscar (aperte enter após digitar):", key="busca_estoque")
 
     # CHECKBOX DE FILTRO DE DISPONIBILIDADE
     # Título principal + Caption abaixo (para fonte menor)
-    somente_disp = st.checkbox("Somente Disponível")
+    somente_disp = st.checkbox("Somente Disponível", key="somente_disp_estoque")
     st.caption("(marque para mostrar somente itens que possuem saldo disponível maior que zero)")
 
     # APLICAÇÃO DOS FILTROS
@@ -849,10 +1937,10 @@ def exibir_aba_estoque():
     if filial_sel != "Todas":
         df_filtrado = df_filtrado[df_filtrado['FILIAL'] == filial_sel]
         
-    # 3. Filtro de Busca
+    # 3. Filtro de Busca (índice montado uma vez por versão do estoque)
     if busca:
-        mask = df_filtrado.astype(str).apply(lambda x: x.str.contains(busca, case=False, na=False)).any(axis=1)
-        df_filtrado = df_filtrado[mask]
+        indice = obter_derivado(carregar_estoque, "indice_busca", lambda: IndiceBusca(df_estoque))
+        df_filtrado = df_filtrado[indice.buscar(busca, index=df_filtrado.index)]
 
     st.markdown(f"**Itens encontrados:** {len(df_filtrado)}")
     
@@ -875,17 +1963,17 @@ def exibir_aba_estoque():
 
     # 2. Formata Espessura
     if 'ESPES' in df_show.columns:
-        df_show['ESPES'] = df_show['ESPES'].apply(lambda x: formatar_br_decimal(x, 2))
+        df_show['ESPES'] = formatar_br_decimal_coluna(df_show['ESPES'], 2)
 
     # 3. Formata Quantidades
     cols_qtd = ['QTDE', 'EMP', 'DISP']
     for col in cols_qtd:
         if col in df_show.columns:
-            df_show[col] = df_show[col].apply(lambda x: formatar_br_decimal(x, 3))
+            df_show[col] = formatar_br_decimal_coluna(df_show[col], 3)
 
     # 4. Formata Comprimento
     if 'COMP' in df_show.columns:
-        df_show['COMP'] = df_show['COMP'].apply(lambda x: str(int(x)) if x > 0 else "0")
+        df_show['COMP'] = df_show['COMP'].where(df_show['COMP'] > 0, 0).astype('int64').astype(str)
 
     # Seleção e Ordem das colunas
     colunas_desejadas = [
@@ -955,19 +2043,20 @@ def exibir_aba_estoque():
         allow_unsafe_jscode=True
     )
 
-def exibir_aba_carteira_geral():
-    tipo_usuario = st.session_state['usuario_tipo'].lower()
-    nome_filtro = st.session_state['usuario_filtro']
-    
-    # Puxa os dados que o robô já manda para a aba Carteira
-    df_carteira = obter_dados_persistentes("cache_carteira_cred", carregar_dados_carteira)
-    
-    if df_carteira.empty:
-        st.info("Nenhum dado de carteira carregado.")
-        return
+def base_busca_carteira(df_c):
+    """Carteira inteira com as mesmas colunas que a tabela da tela tem na hora da busca."""
+    base = df_c.copy()
+    base['TONS_NUM'] = converter_coluna_numerica(base['TONS'])
+    base['PESO (TONS)'] = formatar_peso_coluna(base['TONS_NUM'])
+    return base.rename(columns={"TONS": "TONS_ORIGINAL"})
 
+def traduzir_carteira_dox(df_carteira):
+    """
+    Troca CLIENTE/VENDEDOR/GERENTE das linhas DOX BRASIL pelos dados do pedido original de
+    SAO PAULO (cruzando pelo PED/PROP SF) e tira SAO PAULO da carteira. Não mexe na entrada.
+    """
     df_c = df_carteira.copy()
-    
+
     # =========================================================================
     # LÓGICA DE TRADUÇÃO (O CÉREBRO)
     # =========================================================================
@@ -1003,6 +2092,25 @@ def exibir_aba_carteira_geral():
     
     # 6. Oculta SAO PAULO (Limpa a tabela final para exibir)
     df_c = df_c[df_c['FILIAL'] != 'SAO PAULO']
+    return df_c
+
+@st.fragment # Digitar na busca ou trocar filtro reexecuta só a carteira, não a barra lateral e o resto do script
+def exibir_aba_carteira_geral():
+    tipo_usuario = st.session_state['usuario_tipo'].lower()
+    nome_filtro = st.session_state['usuario_filtro']
+    
+    # Puxa os dados que o robô já manda para a aba Carteira
+    df_carteira = obter_dados_persistentes("cache_carteira_cred", carregar_dados_carteira)
+    
+    if df_carteira.empty:
+        st.info("Nenhum dado de carteira carregado.")
+        return
+
+    # Tradução DOX BRASIL feita uma vez por versão da carteira e compartilhada entre as sessões
+    df_c = obter_derivado(carregar_dados_carteira, "carteira_traduzida", lambda: traduzir_carteira_dox(df_carteira))
+    # Nomes já normalizados e filtros já resolvidos (uma vez por versão da carteira)
+    indices = indices_usuarios(carregar_dados_carteira, df_c, ["VENDEDOR", "GERENTE"])
+    df_c_completa = df_c
     
     # --- NOVO: FILTRO DE FILIAL ---
     lista_filiais = ["Todas"] + sorted(df_c['FILIAL'].dropna().unique().tolist())
@@ -1013,34 +2121,31 @@ def exibir_aba_carteira_geral():
     # =========================================================================
     # APLICAÇÃO DE REGRAS DE PERFIL
     # =========================================================================
+    filtro_vendedor = None
     if tipo_usuario in ["admin", "gerente", "master", "logística", "logistica", "pcp"]:
         vendedores_unicos = sorted(df_c["VENDEDOR"].dropna().unique())
-        filtro_vendedor = st.selectbox("Filtrar Vendedor (Carteira)", ["Todos"] + vendedores_unicos)
+        filtro_vendedor = st.selectbox("Filtrar Vendedor (Carteira)", ["Todos"] + vendedores_unicos, key="vendedor_carteira")
         if filtro_vendedor != "Todos": 
             df_filtrado = df_c[df_c["VENDEDOR"] == filtro_vendedor].copy()
         else: 
             df_filtrado = df_c.copy()
             
     elif tipo_usuario == "gerente comercial":
-        nome_busca = nome_filtro.lower().strip()
         mask_gerente = pd.Series(False, index=df_c.index)
         mask_vendedor = pd.Series(False, index=df_c.index)
         
-        if "GERENTE" in df_c.columns: 
-            df_c["GERENTE_CLEAN"] = df_c["GERENTE"].astype(str).str.lower().str.strip()
-            mask_gerente = df_c["GERENTE_CLEAN"].str.contains(nome_busca, na=False)
+        if "GERENTE" in indices: 
+            mask_gerente = indices["GERENTE"].mascara(nome_filtro, df_c.index)
             
-        if "VENDEDOR" in df_c.columns:
-            df_c["VENDEDOR_CLEAN"] = df_c["VENDEDOR"].astype(str).str.lower().str.strip()
-            mask_vendedor = df_c["VENDEDOR_CLEAN"].str.contains(nome_busca, regex=False, na=False)
+        if "VENDEDOR" in indices:
+            mask_vendedor = indices["VENDEDOR"].mascara(nome_filtro, df_c.index)
             
         # O símbolo '|' significa "OU" (Junta o que ele é gerente com o que ele é vendedor)
         df_filtrado = df_c[mask_gerente | mask_vendedor].copy()
             
     else: # Vendedores Padrão
-        if "VENDEDOR" in df_c.columns:
-            df_c["VENDEDOR_CLEAN"] = df_c["VENDEDOR"].astype(str).str.lower().str.strip()
-            df_filtrado = df_c[df_c["VENDEDOR_CLEAN"].str.contains(nome_filtro.lower().strip(), regex=False, na=False)].copy()
+        if "VENDEDOR" in indices:
+            df_filtrado = df_c[indices["VENDEDOR"].mascara(nome_filtro, df_c.index)].copy()
         else:
             df_filtrado = pd.DataFrame()
             
@@ -1052,7 +2157,7 @@ def exibir_aba_carteira_geral():
         return
 
     # Cálculos Totais
-    df_filtrado['TONS_NUM'] = df_filtrado['TONS'].apply(converte_numero_seguro)
+    df_filtrado['TONS_NUM'] = converter_coluna_numerica(df_filtrado['TONS'])
     total_pedidos = len(df_filtrado)
     total_peso = df_filtrado['TONS_NUM'].sum()
     total_peso_str = f"{total_peso:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -1063,10 +2168,10 @@ def exibir_aba_carteira_geral():
     st.divider()
 
     # Filtro de Busca da Tabela
-    texto_busca = st.text_input("🔍 Buscar na Carteira (Cliente, Pedido, Produto, Lote...):")
+    texto_busca = st.text_input("🔍 Buscar na Carteira (Cliente, Pedido, Produto, Lote...):", key="busca_carteira")
     
     df_show = df_filtrado.copy()
-    df_show['PESO (TONS)'] = df_show['TONS_NUM'].apply(formatar_peso_brasileiro)
+    df_show['PESO (TONS)'] = formatar_peso_coluna(df_show['TONS_NUM'])
     df_show = df_show.rename(columns={"TONS": "TONS_ORIGINAL"}) # Proteção
     
     # Configuração de Colunas Base
@@ -1082,8 +2187,8 @@ def exibir_aba_carteira_geral():
             colunas_visiveis.insert(4, "GERENTE")
 
     if texto_busca:
-        mask = df_show.astype(str).apply(lambda x: x.str.contains(texto_busca, case=False, na=False)).any(axis=1)
-        df_show = df_show[mask]
+        indice = obter_derivado(carregar_dados_carteira, "indice_busca", lambda: IndiceBusca(base_busca_carteira(df_c_completa)))
+        df_show = df_show[indice.buscar(texto_busca, index=df_show.index)]
         
     if df_show.empty:
         st.warning(f"Nenhum resultado encontrado para '{texto_busca}'")
@@ -1102,15 +2207,19 @@ def exibir_aba_carteira_geral():
 
         # --- NOVO: BOTÃO DE DOWNLOAD EXCEL FORMATADO ---
         st.markdown("<br>", unsafe_allow_html=True)
-        excel_carteira = gerar_excel_formatado(df_show[cols_finais])
-        st.download_button(
-            label="📥 Baixar Tabela (Excel)",
-            data=excel_carteira,
-            file_name=f"Carteira_Pedidos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="btn_down_carteira"
-        )
+        filtro_excel = (tipo_usuario, nome_filtro, filtro_filial, filtro_vendedor, texto_busca, tuple(cols_finais))
+        botao_excel(df_show[cols_finais], carregar_dados_carteira, filtro_excel, "Carteira_Pedidos", "btn_down_carteira")
 
+def base_busca_pedidos(df_total):
+    """Todos os itens com Peso e Prazo já no formato da tela (o que o usuário enxerga é o que ele busca)."""
+    base = df_total.copy()
+    base['Peso (ton)'] = formatar_peso_coluna(converter_coluna_numerica(base['Quantidade']))
+    try:
+        base['Prazo'] = pd.to_datetime(base['Prazo'], dayfirst=True, errors='coerce').dt.strftime('%d/%m/%Y').fillna("-")
+    except: pass
+    return base
+
+@st.fragment
 def exibir_carteira_pedidos():
     tipo_usuario = st.session_state['usuario_tipo'].lower()
     
@@ -1118,37 +2227,39 @@ def exibir_carteira_pedidos():
     df_total = obter_dados_persistentes("cache_pedidos", carregar_dados_pedidos)
 
     if not df_total.empty:
+        indices = indices_usuarios(carregar_dados_pedidos, df_total, ["Vendedor Correto", "Gerente Correto"])
+        df_pedidos_completo = df_total
         df_total = df_total.dropna(subset=["Número do Pedido"])
         df_total = df_total[~df_total["Número do Pedido"].isin(["000nan", "00None", "000000"])]
-        filtro_filial = st.selectbox("Selecione a Filial:", ["Todas", "PINHEIRAL", "SJ BICAS"])
+        filtro_filial = st.selectbox("Selecione a Filial:", ["Todas", "PINHEIRAL", "SJ BICAS"], key="filial_pedidos")
         if filtro_filial != "Todas":
             df_total = df_total[df_total["Filial_Origem"] == filtro_filial]
         nome_filtro = st.session_state['usuario_filtro']
+        filtro_vendedor = None
         if tipo_usuario in ["admin", "gerente", "master", "logística", "logistica", "pcp"]:
             vendedores_unicos = sorted(df_total["Vendedor Correto"].dropna().unique())
-            filtro_vendedor = st.selectbox(f"Filtrar Vendedor ({tipo_usuario.capitalize()})", ["Todos"] + vendedores_unicos)
+            filtro_vendedor = st.selectbox(f"Filtrar Vendedor ({tipo_usuario.capitalize()})", ["Todos"] + vendedores_unicos, key="vendedor_pedidos")
             if filtro_vendedor != "Todos": df_filtrado = df_total[df_total["Vendedor Correto"] == filtro_vendedor].copy()
             else: df_filtrado = df_total.copy()
         elif tipo_usuario == "gerente comercial":
-            nome_busca = nome_filtro.lower().strip()
             mask_gerente = pd.Series(False, index=df_total.index)
             mask_vendedor = pd.Series(False, index=df_total.index)
             
-            if "Gerente Correto" in df_total.columns: 
-                mask_gerente = df_total["Gerente Correto"].astype(str).str.lower().str.strip().str.contains(nome_busca, na=False)
+            if "Gerente Correto" in indices: 
+                mask_gerente = indices["Gerente Correto"].mascara(nome_filtro, df_total.index)
                 
-            if "Vendedor Correto" in df_total.columns:
-                mask_vendedor = df_total["Vendedor Correto"].astype(str).str.lower().str.strip().str.contains(nome_busca, regex=False, na=False)
+            if "Vendedor Correto" in indices:
+                mask_vendedor = indices["Vendedor Correto"].mascara(nome_filtro, df_total.index)
                 
             df_filtrado = df_total[mask_gerente | mask_vendedor].copy()
         else: 
-            df_filtrado = df_total[df_total["Vendedor Correto"].str.lower().str.contains(nome_filtro.lower(), regex=False, na=False)].copy()
+            df_filtrado = df_total[indices["Vendedor Correto"].mascara(nome_filtro, df_total.index)].copy()
         if df_filtrado.empty: st.info(f"Nenhum pedido pendente encontrado para a filial selecionada.")
         else:
             # --- APLICANDO A FUNÇÃO SEGURA TAMBÉM NOS PEDIDOS ---
-            df_filtrado['Quantidade_Num'] = df_filtrado['Quantidade'].apply(converte_numero_seguro)
+            df_filtrado['Quantidade_Num'] = converter_coluna_numerica(df_filtrado['Quantidade'])
             
-            df_filtrado['Peso (ton)'] = df_filtrado['Quantidade_Num'].apply(formatar_peso_brasileiro)
+            df_filtrado['Peso (ton)'] = formatar_peso_coluna(df_filtrado['Quantidade_Num'])
             try:
                 df_filtrado['Prazo_dt'] = pd.to_datetime(df_filtrado['Prazo'], dayfirst=True, errors='coerce')
                 df_filtrado['Prazo'] = df_filtrado['Prazo_dt'].dt.strftime('%d/%m/%Y').fillna("-")
@@ -1167,10 +2278,10 @@ def exibir_carteira_pedidos():
             kpi1.metric("Itens Programados:", total_pedidos)
             kpi2.metric("Volume Total (Tons):", total_peso_str)
             st.divider()
-            texto_busca = st.text_input("🔍 Filtro (Cliente, Pedido, Produto...):")
+            texto_busca = st.text_input("🔍 Filtro (Cliente, Pedido, Produto...):", key="busca_pedidos")
             if texto_busca:
-                mask = df_final.astype(str).apply(lambda x: x.str.contains(texto_busca, case=False, na=False)).any(axis=1)
-                df_exibicao = df_final[mask]
+                indice = obter_derivado(carregar_dados_pedidos, "indice_busca", lambda: IndiceBusca(base_busca_pedidos(df_pedidos_completo)))
+                df_exibicao = df_final[indice.buscar(texto_busca, colunas_finais, df_final.index)]
             else: df_exibicao = df_final
             st.dataframe(df_exibicao, hide_index=True, use_container_width=True, column_config={"Prazo": st.column_config.TextColumn("Previsão"), "Filial_Origem": st.column_config.TextColumn("Filial")})
             
@@ -1178,14 +2289,8 @@ def exibir_carteira_pedidos():
             
             # --- NOVO: BOTÃO DE DOWNLOAD EXCEL FORMATADO ---
             st.markdown("<br>", unsafe_allow_html=True)
-            excel_itens = gerar_excel_formatado(df_exibicao)
-            st.download_button(
-                label="📥 Baixar Tabela (Excel)",
-                data=excel_itens,
-                file_name=f"Itens_Programados_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                key="btn_down_itens"
-            )
+            filtro_excel = (tipo_usuario, nome_filtro, filtro_filial, filtro_vendedor, texto_busca, tuple(colunas_finais))
+            botao_excel(df_exibicao, carregar_dados_pedidos, filtro_excel, "Itens_Programados", "btn_down_itens")
             
     else: 
         st.error("Não foi possível carregar a planilha de pedidos. Tente atualizar a página.")
@@ -1241,9 +2346,9 @@ def mostrar_detalhes_titulos(cliente_nome, df_titulos):
         
         # Formatando valor como moeda para exibição
         if "VALOR" in df_show.columns:
-            df_show["VALOR"] = df_show["VALOR"].apply(formatar_moeda)
+            df_show["VALOR"] = formatar_moeda_coluna(df_show["VALOR"])
         if "SALDO" in df_show.columns:
-            df_show["SALDO"] = df_show["SALDO"].apply(formatar_moeda)
+            df_show["SALDO"] = formatar_moeda_coluna(df_show["SALDO"])
 
         # Selecionar colunas relevantes para o vendedor
         cols_visual = [
@@ -1267,6 +2372,25 @@ def mostrar_detalhes_titulos(cliente_nome, df_titulos):
             }
         )
 
+def formatar_tabela_credito(df_credito, cols_order, cols_financeiras):
+    """Colunas do painel de crédito na ordem da tela, com dias inteiros e valores em R$ (tudo texto)."""
+    cols_existentes = [c for c in cols_order if c in df_credito.columns]
+    df_fmt = df_credito[cols_existentes].copy()
+
+    # Tratamento de Dias e Moeda
+    cols_dias = ["DIAS_PARA_VENCER_LC", "DIAS_PARA_VENCER_TITULO", "DIAS_EM_ATRASO_RECEBIVEIS"]
+    for col in cols_dias:
+        if col in df_fmt.columns:
+            dias = pd.to_numeric(df_fmt[col], errors='coerce')
+            df_fmt[col] = np.trunc(dias).astype('Int64').astype(str).where(dias.notna(), "")
+
+    for col in cols_financeiras:
+        if col in df_fmt.columns:
+            df_fmt[col] = formatar_moeda_coluna(df_fmt[col])
+
+    return df_fmt.astype(str).replace(['None', 'nan', 'NaT', '<NA>', 'nan.0'], '')
+
+@st.fragment # Selecionar um cliente na tabela (on_select="rerun") reexecuta só esta seção
 def exibir_aba_credito():
     st.markdown("### 💰 Painel de Crédito <small style='font-weight: normal; font-size: 14px; color: gray;'>(Aba em teste. Qualquer divergência, por favor reporte.)</small>", unsafe_allow_html=True)
     
@@ -1375,22 +2499,23 @@ def exibir_aba_credito():
     # 3. Filtragem Global (Vendedor Logado)
     tipo_usuario = st.session_state['usuario_tipo'].lower()
     nome_usuario = st.session_state['usuario_filtro']
-    nome_usuario_limpo = nome_usuario.strip().lower()
+    indices = indices_usuarios(carregar_dados_credito, df_credito, ["VENDEDOR", "GERENTE"])
+    # Tabela já formatada para a tela (dias e moeda), montada uma vez por versão do crédito
+    df_credito_fmt = obter_derivado(carregar_dados_credito, "tabela_formatada",
+                                    lambda: formatar_tabela_credito(df_credito, cols_order, cols_financeiras))
 
     if tipo_usuario in ["admin", "master", "gerente"]:
-        df_base = df_credito.copy()
+        df_base = df_credito_fmt.copy()
         
     elif tipo_usuario == "gerente comercial":
-        if "GERENTE" in df_credito.columns:
-            df_credito["GERENTE_CLEAN"] = df_credito["GERENTE"].astype(str).str.strip().str.lower()
-            df_base = df_credito[df_credito["GERENTE_CLEAN"].str.contains(nome_usuario_limpo, na=False)].copy()
+        if "GERENTE" in indices:
+            df_base = df_credito_fmt[indices["GERENTE"].mascara(nome_usuario)].copy()
         else:
             df_base = pd.DataFrame()
             
     else:
-        if "VENDEDOR" in df_credito.columns:
-            df_credito["VENDEDOR_CLEAN"] = df_credito["VENDEDOR"].astype(str).str.strip().str.lower()
-            df_base = df_credito[df_credito["VENDEDOR_CLEAN"].str.contains(nome_usuario_limpo, na=False)].copy()
+        if "VENDEDOR" in indices:
+            df_base = df_credito_fmt[indices["VENDEDOR"].mascara(nome_usuario)].copy()
         else:
             df_base = pd.DataFrame()
 
@@ -1399,8 +2524,6 @@ def exibir_aba_credito():
         return
 
     # 4. Tratamento Prévio
-    cols_existentes = [c for c in cols_order if c in df_base.columns]
-    df_base = df_base[cols_existentes].copy()
 
     # --- INSERÇÃO DA COLUNA ISCA (AJUSTADA V63) ---
     # Inserimos a coluna "DETALHES" na posição 0 com a seta e ajuste de largura
@@ -1413,23 +2536,12 @@ def exibir_aba_credito():
         if "VENDEDOR" in df_base.columns: df_base = df_base.drop(columns=["VENDEDOR"])
         if "GERENTE" in df_base.columns: df_base = df_base.drop(columns=["GERENTE"])
 
-    # Tratamento de Dias e Moeda
-    cols_dias = ["DIAS_PARA_VENCER_LC", "DIAS_PARA_VENCER_TITULO", "DIAS_EM_ATRASO_RECEBIVEIS"]
-    for col in cols_dias:
-        if col in df_base.columns:
-            df_base[col] = pd.to_numeric(df_base[col], errors='coerce').apply(lambda x: f"{int(x)}" if pd.notnull(x) else "")
-
-    for col in cols_financeiras:
-        if col in df_base.columns:
-            df_base[col] = df_base[col].apply(formatar_moeda)
-
-    df_base = df_base.astype(str).replace(['None', 'nan', 'NaT', '<NA>', 'nan.0'], '')
-
-    # 5. Filtro de Busca
-    texto_busca_credito = st.text_input("🔍 Filtrar Clientes (CNPJ, Nome...):")
+    # 5. Filtro de Busca (nas colunas visíveis; a coluna DETALHES é só o texto do botão)
+    texto_busca_credito = st.text_input("🔍 Filtrar Clientes (CNPJ, Nome...):", key="busca_credito")
     if texto_busca_credito:
-        mask = df_base.astype(str).apply(lambda x: x.str.contains(texto_busca_credito, case=False, na=False)).any(axis=1)
-        df_base = df_base[mask]
+        indice = obter_derivado(carregar_dados_credito, "indice_busca", lambda: IndiceBusca(df_credito_fmt))
+        colunas_busca = [c for c in df_base.columns if c != "DETALHES"]
+        df_base = df_base[indice.buscar(texto_busca_credito, colunas_busca, df_base.index)]
 
     # 6. Separação: Com Pedido vs Sem Pedido
     lista_clientes_com_pedido = []
@@ -1633,7 +2745,7 @@ def exibir_aba_manutencao():
     
     # Botão de atualizar geral
     if st.button("🔄 Atualizar Dados Manutenção"):
-        carregar_dados_manutencao.clear()
+        recarregar_dados(carregar_dados_manutencao)
         st.rerun()
         
     df = obter_dados_persistentes("cache_manutencao", carregar_dados_manutencao)
@@ -1652,7 +2764,7 @@ def exibir_aba_manutencao():
         st.markdown("### 📋 Fila de Chamados Pendentes")
         
         # Filtro visual da tabela
-        filtro_status = st.radio("Filtrar Tabela:", ["Pendentes (Abertos/Andamento)", "Histórico Completo"], horizontal=True)
+        filtro_status = st.radio("Filtrar Tabela:", ["Pendentes (Abertos/Andamento)", "Histórico Completo"], horizontal=True, key="status_manutencao")
         
         if filtro_status == "Pendentes (Abertos/Andamento)":
             df_show = df[df['Status'].str.strip().str.lower() != 'concluido'].copy()
@@ -1737,11 +2849,16 @@ def exibir_aba_manutencao():
                         str_inicio = f"{d_ini_input.strftime('%d/%m/%Y')} {h_ini_input.strftime('%H:%M')}"
                         str_fim = f"{d_fim_input.strftime('%d/%m/%Y')} {h_fim_input.strftime('%H:%M')}"
                         
-                        if atualizar_chamado_manutencao(id_real, novo_status, nova_prioridade, novo_mecanico, str_inicio, str_fim, nova_solucao):
+                        resultado = atualizar_chamado_manutencao(id_real, novo_status, nova_prioridade, novo_mecanico, str_inicio, str_fim, nova_solucao,
+                                                                 data_abertura_esperada=linha_atual['Data_Abertura'])
+                        if resultado == "ok":
                             st.success("✅ Chamado atualizado com sucesso!")
-                            carregar_dados_manutencao.clear()
+                            recarregar_dados(carregar_dados_manutencao)
                             time.sleep(1)
                             st.rerun()
+                        elif resultado == "linha_mudou":
+                            st.error("Este chamado mudou de linha na planilha (nada foi gravado). Selecione o chamado de novo e tente outra vez.")
+                            recarregar_dados(carregar_dados_manutencao) # A próxima tela já vem com as linhas certas
                         else:
                             st.error("Erro ao conectar com a planilha.")
 
@@ -1859,265 +2976,337 @@ def exibir_aba_manutencao():
                 ).properties(height=300)
                 st.altair_chart(graf_qtd, use_container_width=True)
 
-# --- SESSÃO ---
-if 'logado' not in st.session_state:
-    st.session_state['logado'] = False
-    st.session_state['usuario_nome'] = ""
-    st.session_state['usuario_filtro'] = ""
-    st.session_state['usuario_email'] = "" 
-    st.session_state['usuario_tipo'] = ""
-if 'fazendo_cadastro' not in st.session_state: st.session_state['fazendo_cadastro'] = False
+def exibir_aba_logs():
+    st.dataframe(carregar_logs_acessos(), use_container_width=True)
+    
+    # --- FILA DE GRAVAÇÃO: o que ainda não chegou na planilha e o que foi descartado ---
+    pendentes, descartados = obter_fila_gravacao().situacao()
+    st.markdown("#### 📤 Fila de Gravação")
+    if pendentes:
+        st.caption("Linhas aguardando envio: " + " | ".join(f"{aba}: {qtd}" for aba, qtd in pendentes.items()))
+    else:
+        st.caption("Nenhuma linha aguardando envio.")
+    if descartados:
+        st.error(f"{len(descartados)} lote(s) não puderam ser gravados e foram descartados:")
+        st.dataframe(pd.DataFrame([{"Quando": d["quando"], "Aba": d["aba"], "Linhas": len(d["linhas"]),
+                                    "Conteúdo": str(d["linhas"]), "Erro": d["erro"]} for d in reversed(descartados)]),
+                     hide_index=True, use_container_width=True)
+
+def secoes_do_perfil(tipo_usuario):
+    """
+    Seções que cada perfil enxerga, na ordem do menu: (rótulo, função que desenha, funções carregar_* que ela usa).
+    Só a seção escolhida é desenhada a cada execução, e só os dados dela são lidos.
+    """
+    tipo = tipo_usuario.lower()
+    carteira = ("📂 Carteira", exibir_aba_carteira_geral, [carregar_dados_carteira])
+    itens = ("📂 Itens Programados", exibir_carteira_pedidos, [carregar_dados_pedidos])
+    credito = ("💰 Crédito", exibir_aba_credito, [carregar_dados_credito, carregar_dados_titulos, carregar_dados_carteira])
+    estoque = ("📦 Estoque", exibir_aba_estoque, [carregar_estoque])
+    def fotos(admin): return ("📷 Fotos RDQ", lambda: exibir_aba_fotos(admin), [carregar_solicitacoes_fotos])
+    def certificados(admin): return ("📑 Certificados", lambda: exibir_aba_certificados(admin), [carregar_solicitacoes_certificados])
+    def notas(admin): return ("🧾 Notas Fiscais", lambda: exibir_aba_notas(admin), [carregar_solicitacoes_notas])
+    faturamento = ("📊 Faturamento", exibir_aba_faturamento, [carregar_dados_faturamento_direto, carregar_dados_faturamento_transf, carregar_metas_faturamento])
+    producao = ("🏭 Produção", exibir_aba_producao, [carregar_dados_producao_nuvem, carregar_metas_producao])
+    manutencao = ("🔧 Manutenção", exibir_aba_manutencao, [carregar_dados_manutencao])
+    
+    if tipo == "admin":
+        acessos = ("📝 Acessos", lambda: st.dataframe(carregar_solicitacoes(), use_container_width=True), [carregar_solicitacoes])
+        logs = ("🔍 Logs", exibir_aba_logs, [carregar_logs_acessos])
+        return [carteira, itens, credito, estoque, fotos(True), acessos, certificados(True), notas(True), logs, faturamento, producao, manutencao]
+    if tipo == "master":
+        return [carteira, itens, credito, estoque, fotos(False), certificados(False), notas(False), faturamento, producao]
+    if tipo in ["logística", "logistica", "pcp"]:
+        return [carteira, itens, estoque, fotos(True), certificados(True), notas(True)]
+    if tipo in ["manutenção", "manutencao"]:
+        return [manutencao]
+    if tipo == "qualidade":
+        return [fotos(True), certificados(True), notas(True)]
+    # Vendedores e Gerentes Padrão
+    return [carteira, itens, credito, estoque, fotos(False), certificados(False), notas(False)]
+
+# Filtros das seções que devem continuar como estavam quando o usuário volta para a seção
+CHAVES_FILTROS_SECOES = ["filial_carteira", "vendedor_carteira", "busca_carteira", "filial_pedidos", "vendedor_pedidos", "busca_pedidos",
+                         "busca_credito", "filial_estoque", "busca_estoque", "somente_disp_estoque", "fat_periodo", "prod_periodo",
+                         "status_manutencao"]
+
+def manter_filtros_das_secoes():
+    """
+    O Streamlit apaga o valor de um widget na execução em que ele não é desenhado (seção fechada).
+    Regravar a chave no session_state faz o valor sobreviver até a seção aparecer de novo.
+    """
+    for chave in CHAVES_FILTROS_SECOES:
+        if chave in st.session_state:
+            st.session_state[chave] = st.session_state[chave]
 
-# --- LOGIN ---
-# --- LOGIN ---
-if not st.session_state['logado']:
+def pre_carregar(funcoes_carregamento):
+    """
+    Deixa prontas as fotos dos conjuntos antes de desenhar a tela: primeiro a cópia em disco
+    (servidor acabou de subir), depois lê em paralelo só o que continuar faltando e já publica
+    o resultado, para o obter_dados_persistentes usar essa leitura em vez de refazer/descartar.
+    """
+    atualizador = obter_atualizador()
+    pendentes = []
+    for funcao in funcoes_carregamento:
+        nome = funcao.__name__
+        if atualizador.ler_snapshot(nome) is None and not atualizador.ja_restaurado(nome):
+            atualizador.restaurar(nome)
+        snapshot = atualizador.ler_snapshot(nome)
+        if snapshot is None or foto_vencida(nome, snapshot):
+            pendentes.append(funcao)
+    if not pendentes: return
+    motor = obter_motor_leitura()
+    futuros = [(funcao, motor["carregadores"].submit(funcao)) for funcao in pendentes]
+    for funcao, futuro in futuros:
+        try:
+            dados = futuro.result()
+        except Exception:
+            continue # A própria seção tenta de novo e trata o erro do jeito dela
+        if dados is not None:
+            atualizador.publicar(funcao.__name__, dados)
 
-    # =========================================================
-    # ASSINATURA DO CRIADOR (APARECE SÓ NO LOGIN)
-    # =========================================================
-    st.markdown("""
-    <style>
-    .assinatura-hugo {
-        position: fixed;
-        bottom: 10px;
-        left: 50%;
-        transform: translateX(-50%);
-        color: #888888;
-        font-size: 14px;
-        font-style: italic;
-        z-index: 100;
-        background-color: rgba(255, 255, 255, 0.6); 
-        padding: 4px 12px;
-        border-radius: 10px;
-        text-align: center;
-        white-space: nowrap;
-    }
-    </style>
-    <div class="assinatura-hugo">Criado por <b>Hugo Sabença</b></div>
-    """, unsafe_allow_html=True)
-    # =========================================================
-    if st.session_state['fazendo_cadastro']:
-        st.title("📝 Solicitação de Acesso")
-        with st.form("form_cadastro"):
-            nome = st.text_input("Nome Completo")
-            email = st.text_input("E-mail")
-            login = st.text_input("Crie um Login")
-            senha = st.text_input("Crie uma Senha", type="password")
-            c1, c2 = st.columns(2)
-            if c1.form_submit_button("Enviar Solicitação", type="primary", use_container_width=True):
-                if nome and email and login and senha:
-                    if salvar_nova_solicitacao(nome, email, login, senha): st.success("Solicitação enviada!")
-                else: st.warning("Preencha tudo.")
-            if c2.form_submit_button("Voltar", use_container_width=True): st.session_state['fazendo_cadastro'] = False; st.rerun()
-    else:
-        # =================================================================
-        # TELA DE LOGIN: ALINHADA À ESQUERDA E COMPACTA
-        # =================================================================
+# ==============================================================================
+# TELA PRINCIPAL (LOGIN + ABAS)
+# ==============================================================================
+
+def main():
+    # --- SESSÃO ---
+    if 'logado' not in st.session_state:
+        st.session_state['logado'] = False
+        st.session_state['usuario_nome'] = ""
+        st.session_state['usuario_filtro'] = ""
+        st.session_state['usuario_email'] = "" 
+        st.session_state['usuario_tipo'] = ""
+    if 'fazendo_cadastro' not in st.session_state: st.session_state['fazendo_cadastro'] = False
+
+    # --- LOGIN ---
+    # --- LOGIN ---
+    if not st.session_state['logado']:
+
+        # =========================================================
+        # ASSINATURA DO CRIADOR (APARECE SÓ NO LOGIN)
+        # =========================================================
+        st.markdown("""
+        <style>
+        .assinatura-hugo {
+            position: fixed;
+            bottom: 10px;
+            left: 50%;
+            transform: translateX(-50%);
+            color: #888888;
+            font-size: 14px;
+            font-style: italic;
+            z-index: 100;
+            background-color: rgba(255, 255, 255, 0.6); 
+            padding: 4px 12px;
+            border-radius: 10px;
+            text-align: center;
+            white-space: nowrap;
+        }
+        </style>
+        <div class="assinatura-hugo">Criado por <b>Hugo Sabença</b></div>
+        """, unsafe_allow_html=True)
+        # =========================================================
+        if st.session_state['fazendo_cadastro']:
+            st.title("📝 Solicitação de Acesso")
+            with st.form("form_cadastro"):
+                nome = st.text_input("Nome Completo")
+                email = st.text_input("E-mail")
+                login = st.text_input("Crie um Login")
+                senha = st.text_input("Crie uma Senha", type="password")
+                c1, c2 = st.columns(2)
+                if c1.form_submit_button("Enviar Solicitação", type="primary", use_container_width=True):
+                    if nome and email and login and senha:
+                        if salvar_nova_solicitacao(nome, email, login, senha): st.success("Solicitação enviada!")
+                    else: st.warning("Preencha tudo.")
+                if c2.form_submit_button("Voltar", use_container_width=True): st.session_state['fazendo_cadastro'] = False; st.rerun()
+        else:
+            # =================================================================
+            # TELA DE LOGIN: ALINHADA À ESQUERDA E COMPACTA
+            # =================================================================
+        
+            # Mantém a aba Usuarios na fila do atualizador enquanto alguém está na tela de login:
+            # assim o diretório já está pronto (e atualizado) quando a pessoa clicar em Acessar
+            obter_atualizador().registrar(carregar_usuarios)
         
-        # Cria duas colunas: A primeira estreita para o login, a segunda vazia para preencher o resto
-        col_login, col_vazia = st.columns([1, 2]) 
+            # Cria duas colunas: A primeira estreita para o login, a segunda vazia para preencher o resto
+            col_login, col_vazia = st.columns([1, 2]) 
 
-        with col_login:
-            st.markdown("<br>", unsafe_allow_html=True) 
-            st.title("🔒 Login - Painel Dox")
-            st.markdown("---")
+            with col_login:
+                st.markdown("<br>", unsafe_allow_html=True) 
+                st.title("🔒 Login - Painel Dox")
+                st.markdown("---")
             
-            # 1. EMPACOTAMENTO: Cria o formulário para "travar" a sincronização
-            with st.form("form_login"):
-                # Inputs
-                u = st.text_input("Login", placeholder="Digite seu usuário").strip()
-                s = st.text_input("Senha", type="password", placeholder="Digite sua senha").strip()
+                # 1. EMPACOTAMENTO: Cria o formulário para "travar" a sincronização
+                with st.form("form_login"):
+                    # Inputs
+                    u = st.text_input("Login", placeholder="Digite seu usuário").strip()
+                    s = st.text_input("Senha", type="password", placeholder="Digite sua senha").strip()
                 
-                st.markdown("<br>", unsafe_allow_html=True)
-
-                # Botões viram submit_buttons
-                c_btn1, c_btn2 = st.columns(2)
-                with c_btn1:
-                    btn_acessar = st.form_submit_button("Acessar", type="primary", use_container_width=True)
-                with c_btn2:
-                    btn_solicitar = st.form_submit_button("Solicitar Acesso", use_container_width=True)
+                    st.markdown("<br>", unsafe_allow_html=True)
+
+                    # Botões viram submit_buttons
+                    c_btn1, c_btn2 = st.columns(2)
+                    with c_btn1:
+                        btn_acessar = st.form_submit_button("Acessar", type="primary", use_container_width=True)
+                    with c_btn2:
+                        btn_solicitar = st.form_submit_button("Solicitar Acesso", use_container_width=True)
             
-            # 2. LÓGICA DE VALIDAÇÃO: Fica FORA do 'with st.form', mas DENTRO da 'with col_login'
-            if btn_acessar:
-                # Validação
-                df = carregar_usuarios()
-                if df.empty: st.error("Erro de conexão.")
-                elif 'Login' not in df.columns or 'Senha' not in df.columns: st.error("Erro técnico.")
-                else:
-                    try:
-                        user = df[(df['Login'].str.strip().str.lower() == u.lower()) & (df['Senha'].str.strip() == s)]
-                        if not user.empty:
-                            d = user.iloc[0]
-                            st.session_state.update({
-                                'logado': True, 
-                                'usuario_nome': d['Nome Vendedor'].split()[0], 
-                                'usuario_filtro': d['Nome Vendedor'], 
-                                'usuario_email': d.get('Email', ''), 
-                                'usuario_tipo': d['Tipo'],
-                                'usuario_login': d['Login']
-                            })
-                            registrar_acesso(u, d['Nome Vendedor'])
-                            st.rerun()
-                        else: st.error("Dados incorretos.")
-                    except Exception as e:
-                        st.error(f"Erro no login: {e}")
+                # 2. LÓGICA DE VALIDAÇÃO: Fica FORA do 'with st.form', mas DENTRO da 'with col_login'
+                if btn_acessar:
+                    # Validação
+                    # Foto compartilhada da aba Usuarios: só vai ao Google se ainda não houver nenhuma
+                    df = obter_dados_persistentes("cache_usuarios", carregar_usuarios)
+                    if df.empty: st.error("Erro de conexão.")
+                    elif 'Login' not in df.columns or 'Senha' not in df.columns: st.error("Erro técnico.")
+                    else:
+                        try:
+                            d = diretorio_usuarios(df).autenticar(u, s)
+                            if d is not None:
+                                st.session_state.update({
+                                    'logado': True, 
+                                    'usuario_nome': d['Nome Vendedor'].split()[0], 
+                                    'usuario_filtro': d['Nome Vendedor'], 
+                                    'usuario_email': d.get('Email', ''), 
+                                    'usuario_tipo': d['Tipo'],
+                                    'usuario_login': d['Login']
+                                })
+                                registrar_acesso(u, d['Nome Vendedor'])
+                                st.rerun()
+                            else: st.error("Dados incorretos.")
+                        except Exception as e:
+                            st.error(f"Erro no login: {e}")
             
-            if btn_solicitar:
-                st.session_state['fazendo_cadastro'] = True
-                st.rerun()
-else:
-    # =========================================================
-    # VERIFICAÇÃO DO POP-UP DE AVISO: NOVA ABA CARTEIRA
-    # =========================================================
-    if 'viu_aviso_carteira' not in st.session_state:
-        df_avisos = obter_dados_persistentes("cache_avisos", carregar_feedbacks_avisos)
-        ja_viu = False
-        
-        if isinstance(df_avisos, pd.DataFrame) and not df_avisos.empty:
-            # Verifica se as colunas necessárias existem para não dar erro
-            if 'Login' in df_avisos.columns and 'Tipo_Aviso' in df_avisos.columns:
-                # Procura se já tem uma linha com o Login dele e o Tipo de Aviso "Lancamento_Carteira"
-                filtro = df_avisos[(df_avisos['Login'].str.lower() == st.session_state['usuario_login'].lower()) & 
-                                   (df_avisos['Tipo_Aviso'] == 'Lancamento_Carteira')]
-                if not filtro.empty:
-                    ja_viu = True
-        
-        if not ja_viu:
-            popup_aviso_carteira()
-        else:
-            st.session_state['viu_aviso_carteira'] = True
-    # =========================================================
+                if btn_solicitar:
+                    st.session_state['fazendo_cadastro'] = True
+                    st.rerun()
+    else:
+        # =========================================================
+        # PRÉ-CARGA: dispara em paralelo as leituras da barra lateral e do aviso
+        # (só na primeira execução após o login; cada seção carrega os próprios dados quando é aberta)
+        # =========================================================
+        manter_filtros_das_secoes()
+        if not st.session_state.get('pre_carga_feita', False):
+            pre_carga = [carregar_status_robo]
+            if 'viu_aviso_carteira' not in st.session_state:
+                pre_carga.append(carregar_feedbacks_avisos)
+            with st.spinner("Os dados estão sendo sincronizados com o servidor. Por favor, aguarde um instante... ⏳"):
+                pre_carregar(pre_carga)
+            st.session_state['pre_carga_feita'] = True
 
-    with st.sidebar:
-        # (O resto do seu código da barra lateral continua aqui embaixo normalmente...)
-        st.write(f"Bem-vindo, **{st.session_state['usuario_nome'].upper()}**")
-        agora = datetime.now(FUSO_BR)
-        dias_semana = {0: 'Segunda-feira', 1: 'Terça-feira', 2: 'Quarta-feira', 3: 'Quinta-feira', 4: 'Sexta-feira', 5: 'Sábado', 6: 'Domingo'}
-        meses = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
-        texto_data = f"{dias_semana[agora.weekday()]}, {agora.day} de {meses[agora.month]} de {agora.year}"
-        
-        # Juntamos a data e o perfil no mesmo bloco para economizar espaço
-        st.markdown(f"<small><i>{texto_data}</i><br><span style='color: gray;'>Perfil: {st.session_state['usuario_tipo']}</span></small>", unsafe_allow_html=True)
-        
         # =========================================================
-        # STATUS DO SERVIDOR (ROBÔ) - COMPACTO
+        # VERIFICAÇÃO DO POP-UP DE AVISO: NOVA ABA CARTEIRA
         # =========================================================
-        df_status = obter_dados_persistentes("cache_status_robo", carregar_status_robo)
-        status_texto = "🔴 Servidor Offline" 
+        if 'viu_aviso_carteira' not in st.session_state:
+            df_avisos = obter_dados_persistentes("cache_avisos", carregar_feedbacks_avisos)
+            ja_viu = False
+        
+            if isinstance(df_avisos, pd.DataFrame) and not df_avisos.empty:
+                # Verifica se as colunas necessárias existem para não dar erro
+                if 'Login' in df_avisos.columns and 'Tipo_Aviso' in df_avisos.columns:
+                    # Procura se já tem uma linha com o Login dele e o Tipo de Aviso "Lancamento_Carteira"
+                    filtro = df_avisos[(df_avisos['Login'].str.lower() == st.session_state['usuario_login'].lower()) & 
+                                       (df_avisos['Tipo_Aviso'] == 'Lancamento_Carteira')]
+                    if not filtro.empty:
+                        ja_viu = True
+        
+            if not ja_viu:
+                popup_aviso_carteira()
+            else:
+                st.session_state['viu_aviso_carteira'] = True
+        # =========================================================
+
+        with st.sidebar:
+            # (O resto do seu código da barra lateral continua aqui embaixo normalmente...)
+            st.write(f"Bem-vindo, **{st.session_state['usuario_nome'].upper()}**")
+            agora = datetime.now(FUSO_BR)
+            dias_semana = {0: 'Segunda-feira', 1: 'Terça-feira', 2: 'Quarta-feira', 3: 'Quinta-feira', 4: 'Sexta-feira', 5: 'Sábado', 6: 'Domingo'}
+            meses = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
+            texto_data = f"{dias_semana[agora.weekday()]}, {agora.day} de {meses[agora.month]} de {agora.year}"
         
-        if isinstance(df_status, pd.DataFrame) and not df_status.empty and 'Ultima_Atualizacao' in df_status.columns:
-            try:
-                ultima_att_str = str(df_status.iloc[0]['Ultima_Atualizacao'])
-                ultima_att_dt = datetime.strptime(ultima_att_str, '%d/%m/%Y %H:%M:%S')
-                ultima_att_dt = FUSO_BR.localize(ultima_att_dt) 
+            # Juntamos a data e o perfil no mesmo bloco para economizar espaço
+            st.markdown(f"<small><i>{texto_data}</i><br><span style='color: gray;'>Perfil: {st.session_state['usuario_tipo']}</span></small>", unsafe_allow_html=True)
+        
+            # =========================================================
+            # STATUS DO SERVIDOR (ROBÔ) - COMPACTO
+            # =========================================================
+            df_status = obter_dados_persistentes("cache_status_robo", carregar_status_robo)
+            status_texto = "🔴 Servidor Offline" 
+        
+            if isinstance(df_status, pd.DataFrame) and not df_status.empty and 'Ultima_Atualizacao' in df_status.columns:
+                try:
+                    ultima_att_str = str(df_status.iloc[0]['Ultima_Atualizacao'])
+                    ultima_att_dt = datetime.strptime(ultima_att_str, '%d/%m/%Y %H:%M:%S')
+                    ultima_att_dt = FUSO_BR.localize(ultima_att_dt) 
                 
-                diferenca_minutos = (agora - ultima_att_dt).total_seconds() / 60
+                    diferenca_minutos = (agora - ultima_att_dt).total_seconds() / 60
                 
-                if diferenca_minutos <= 25:
-                    status_texto = "🟢 Servidor Online"
-            except:
-                pass
+                    if diferenca_minutos <= 25:
+                        status_texto = "🟢 Servidor Online"
+                except:
+                    pass
         
-        # Exibe o status com uma margem pequena usando HTML (sem a linha gigante)
-        st.markdown(f"<div style='margin-top: 15px; margin-bottom: 15px;'><b>{status_texto}</b></div>", unsafe_allow_html=True)
-        # =========================================================
+            # Exibe o status com uma margem pequena usando HTML (sem a linha gigante)
+            st.markdown(f"<div style='margin-top: 15px; margin-bottom: 15px;'><b>{status_texto}</b></div>", unsafe_allow_html=True)
+            # =========================================================
 
-        # Botões lado a lado para economizar espaço
-        col_btn1, col_btn2 = st.columns(2)
-        with col_btn1:
-            if st.button("Sair", use_container_width=True): 
-                st.session_state.update({'logado': False, 'usuario_nome': ""})
-                st.rerun()
-        with col_btn2:
-            if st.button("Atualizar", use_container_width=True): 
-                st.cache_data.clear()
-                st.rerun()
+            # Botões lado a lado para economizar espaço
+            col_btn1, col_btn2 = st.columns(2)
+            with col_btn1:
+                if st.button("Sair", use_container_width=True): 
+                    descarregar_fila_gravacao() # Envia já o que estiver pendente (acesso, ciência de aviso)
+                    st.session_state.update({'logado': False, 'usuario_nome': "", 'pre_carga_feita': False, 'secoes_carregadas': set()})
+                    st.rerun()
+            with col_btn2:
+                if st.button("Atualizar", use_container_width=True): 
+                    st.cache_data.clear()
+                    obter_atualizador().descartar()
+                    st.session_state['secoes_carregadas'] = set()
+                    st.rerun()
         
-        st.divider() # Deixamos apenas UMA linha divisória antes do desempenho
+            st.divider() # Deixamos apenas UMA linha divisória antes do desempenho
         
-        # --- BLOCO: FATURAMENTO DO VENDEDOR (VISÍVEL APENAS PARA VENDEDOR) ---
-        if st.session_state['usuario_tipo'].lower() == "vendedor":
-            # Usa a sua função de blindagem para usar o cache antigo e nunca retornar 'None'
-            df_fat_vend = obter_dados_persistentes("cache_fat_vendedor", carregar_faturamento_vendedores)
+            # --- BLOCO: FATURAMENTO DO VENDEDOR (VISÍVEL APENAS PARA VENDEDOR) ---
+            if st.session_state['usuario_tipo'].lower() == "vendedor":
+                # Usa a sua função de blindagem para usar o cache antigo e nunca retornar 'None'
+                df_fat_vend = obter_dados_persistentes("cache_fat_vendedor", carregar_faturamento_vendedores)
             
-            if not df_fat_vend.empty and 'VENDEDOR' in df_fat_vend.columns and 'DATA_DT' in df_fat_vend.columns:
-                usuario_atual = st.session_state['usuario_filtro']
+                if not df_fat_vend.empty and 'VENDEDOR' in df_fat_vend.columns and 'DATA_DT' in df_fat_vend.columns:
+                    usuario_atual = st.session_state['usuario_filtro']
                 
-                # Filtro Mês/Ano Corrente
-                df_mes = df_fat_vend[
-                    (df_fat_vend['DATA_DT'].dt.month == agora.month) & 
-                    (df_fat_vend['DATA_DT'].dt.year == agora.year)
-                ]
+                    # Filtro Mês/Ano Corrente
+                    df_mes = df_fat_vend[
+                        (df_fat_vend['DATA_DT'].dt.month == agora.month) & 
+                        (df_fat_vend['DATA_DT'].dt.year == agora.year)
+                    ]
                 
-                # Filtro Usuário (Lógica de "Contém")
-                df_mes['VENDEDOR_CLEAN'] = df_mes['VENDEDOR'].astype(str).str.upper().str.strip()
-                user_clean = str(usuario_atual).upper().strip()
+                    # Filtro Usuário (Lógica de "Contém")
+                    df_mes['VENDEDOR_CLEAN'] = df_mes['VENDEDOR'].astype(str).str.upper().str.strip()
+                    user_clean = str(usuario_atual).upper().strip()
                 
-                df_user = df_mes[df_mes['VENDEDOR_CLEAN'].str.contains(user_clean, regex=False, na=False)]
+                    df_user = df_mes[df_mes['VENDEDOR_CLEAN'].str.contains(user_clean, regex=False, na=False)]
                 
-                total_tons = df_user['TONS'].sum()
+                    total_tons = df_user['TONS'].sum()
                 
-                st.markdown(f"### 🎯 Seu Desempenho")
-                st.caption(f"Faturado em {meses[agora.month]}:")
-                st.metric("Total (Tons)", f"{total_tons:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-
-    with st.spinner("Os dados estão sendo sincronizados com o servidor. Por favor, aguarde um instante... ⏳"):
-        
-        if st.session_state['usuario_tipo'].lower() == "admin":
-            # Adicionei "📂 Carteira" no início (a0)
-            a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11 = st.tabs(["📂 Carteira", "📂 Itens Programados", "💰 Crédito", "📦 Estoque", "📷 Fotos RDQ", "📝 Acessos", "📑 Certificados", "🧾 Notas Fiscais", "🔍 Logs", "📊 Faturamento", "🏭 Produção", "🔧 Manutenção"])
-            
-            with a0: exibir_aba_carteira_geral()
-            with a1: exibir_carteira_pedidos()
-            with a2: exibir_aba_credito()
-            with a3: exibir_aba_estoque()
-            with a4: exibir_aba_fotos(True)
-            with a5: st.dataframe(carregar_solicitacoes(), use_container_width=True)
-            with a6: exibir_aba_certificados(True)
-            with a7: exibir_aba_notas(True) 
-            with a8: st.dataframe(carregar_logs_acessos(), use_container_width=True)
-            with a9: exibir_aba_faturamento()
-            with a10: exibir_aba_producao()
-            with a11: exibir_aba_manutencao() 
-            
-        elif st.session_state['usuario_tipo'].lower() == "master":
-            a0, a1, a2, a3, a4, a5, a6, a7, a8 = st.tabs(["📂 Carteira", "📂 Itens Programados", "💰 Crédito", "📦 Estoque", "📷 Fotos RDQ", "📑 Certificados", "🧾 Notas Fiscais", "📊 Faturamento", "🏭 Produção"])
-            with a0: exibir_aba_carteira_geral()
-            with a1: exibir_carteira_pedidos()
-            with a2: exibir_aba_credito()
-            with a3: exibir_aba_estoque() 
-            with a4: exibir_aba_fotos(False) 
-            with a5: exibir_aba_certificados(False) 
-            with a6: exibir_aba_notas(False)        
-            with a7: exibir_aba_faturamento()
-            with a8: exibir_aba_producao()
-
-        elif st.session_state['usuario_tipo'].lower() in ["logística", "logistica", "pcp"]:
-            a0, a1, a2, a3, a4, a5 = st.tabs(["📂 Carteira", "📂 Itens Programados", "📦 Estoque", "📷 Fotos RDQ", "📑 Certificados", "🧾 Notas Fiscais"])
-            with a0: exibir_aba_carteira_geral()
-            with a1: exibir_carteira_pedidos()
-            with a2: exibir_aba_estoque()
-            with a3: exibir_aba_fotos(True) 
-            with a4: exibir_aba_certificados(True) 
-            with a5: exibir_aba_notas(True) 
-
-        elif st.session_state['usuario_tipo'].lower() in ["manutenção", "manutencao"]:
-            tabs_manu = st.tabs(["🔧 Manutenção"])
-            with tabs_manu[0]: exibir_aba_manutencao()
-
-        elif st.session_state['usuario_tipo'].lower() == "qualidade":
-            a1, a2, a3 = st.tabs(["📷 Fotos RDQ", "📑 Certificados", "🧾 Notas Fiscais"])
-            with a1: exibir_aba_fotos(True) 
-            with a2: exibir_aba_certificados(True) 
-            with a3: exibir_aba_notas(True)    
-            
-        else:
-            # Vendedores e Gerentes Padrão
-            a0, a1, a2, a3, a4, a5, a6 = st.tabs(["📂 Carteira", "📂 Itens Programados", "💰 Crédito", "📦 Estoque", "📷 Fotos RDQ", "📑 Certificados", "🧾 Notas Fiscais"])
-            with a0: exibir_aba_carteira_geral()
-            with a1: exibir_carteira_pedidos()
-            with a2: exibir_aba_credito()
-            with a3: exibir_aba_estoque() 
-            with a4: exibir_aba_fotos(False) 
-            with a5: exibir_aba_certificados(False)
-            with a6: exibir_aba_notas(False)
\ No newline at end of file
+                    st.markdown(f"### 🎯 Seu Desempenho")
+                    st.caption(f"Faturado em {meses[agora.month]}:")
+                    st.metric("Total (Tons)", f"{total_tons:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+
+        # --- NAVEGAÇÃO: só a seção escolhida roda e lê dados ---
+        secoes = secoes_do_perfil(st.session_state['usuario_tipo'])
+        rotulos = [rotulo for rotulo, _, _ in secoes]
+        if st.session_state.get('secao_ativa') not in rotulos:
+            st.session_state['secao_ativa'] = rotulos[0] # Perfil trocou (ou primeira vez): abre a primeira seção
+        if len(secoes) > 1:
+            st.radio("Seção:", rotulos, horizontal=True, key="secao_ativa", label_visibility="collapsed")
+        rotulo, exibir, carregadores = secoes[rotulos.index(st.session_state['secao_ativa'])]
+        
+        with st.spinner("Os dados estão sendo sincronizados com o servidor. Por favor, aguarde um instante... ⏳"):
+            # Primeira visita à seção nesta sessão: lê as planilhas dela em paralelo antes de desenhar
+            carregadas = st.session_state.setdefault('secoes_carregadas', set())
+            if rotulo not in carregadas:
+                pre_carregar(carregadores)
+                carregadas.add(rotulo)
+            exibir()
+
+if __name__ == "__main__":
+    main()